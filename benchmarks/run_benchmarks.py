@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Performance benchmarks for `tde_spectra_fit`, run on the bundled example spectra.
+
+Measures likelihood evaluations per second for every break number (one call per
+walker and batched), do_fit wall time and peak memory at several (nwalkers, nsteps)
+sizes, the chain storage of each storage policy, the grid backend against emcee
+on each example spectrum (wall time, model evaluations and the offset of the
+medians), and SEM throughput on arrays of samples. Results are compared against
+the baselines stored in baselines.json; a metric that is worse than its baseline
+by more than the threshold counts as a regression and the script exits with
+status 1. Accuracy metrics (offset_sigma) are instead allowed to grow by a fixed
+amount, see ABSOLUTE_TOLERANCES.
+
+Usage, from the repository root (or drop PYTHONPATH after pip install -e .):
+    PYTHONPATH=. python benchmarks/run_benchmarks.py [--quick] [--save]
+        [--threshold 0.25]
+
+Baselines are machine dependent, re-run with --save after changing machines. Timings
+on shared or single-core machines can vary by ~30% between runs; raise --threshold
+there rather than chasing noise.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import numpy as np  # noqa: E402
+
+from tde_spectra_fit.examples import reference_spectra  # noqa: E402
+from tde_spectra_fit.likelihood import (  # noqa: E402
+    log_probability,
+    log_probability_vectorized,
+)
+from tde_spectra_fit.grid import GridBackend  # noqa: E402
+from tde_spectra_fit.SEM import SEM  # noqa: E402
+from tde_spectra_fit.tde_spectra_fit import TDE_fit  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# (nwalkers, nsteps) sizes for the do_fit benchmarks:
+FIT_SIZES = [(32, 500), (100, 1000), (400, 1000)]
+QUICK_FIT_SIZES = [(32, 500)]
+# emcee (nwalkers, nsteps) the grid backend is compared with:
+GRID_EMCEE_SIZES = [(100, 4000)]
+QUICK_GRID_EMCEE_SIZES = [(32, 2000)]
+
+
+def best_of(func, repeat):
+    """ Smallest wall time of repeat calls of func, in seconds. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_likelihood(nwalkers=400, repeat=15):
+    results = {}
+    rng = np.random.default_rng(0)
+    for spectrum_name, spectrum in reference_spectra.items():
+        fit = TDE_fit(**spectrum)
+        args = (fit.frequency, fit.flux_emission, [fit.fd_err_low, fit.fd_err_up])
+        # walkers scattered about the initial guess, some outside the prior box:
+        scatter = 1 + 0.3 * rng.standard_normal((nwalkers, 4))
+        theta = np.array([*fit.initial, -3]) * scatter
+        for break_number in range(1, 12):
+
+            def per_walker():
+                for t in theta:
+                    log_probability(t, *args, break_number)
+
+            def batched():
+                log_probability_vectorized(theta, *args, break_number)
+
+            with np.errstate(all='ignore'):
+                for mode, func in (('per_walker', per_walker), ('batched', batched)):
+                    seconds = best_of(func, repeat)
+                    key = f'likelihood.{spectrum_name}.break{break_number}.{mode}'
+                    results[f'{key}.evals_per_second'] = nwalkers / seconds
+    return results
+
+
+def run_fit(nwalkers, nsteps, vectorize=False, plot=True, **storage):
+    np.random.seed(42)
+    fit = TDE_fit(
+        **reference_spectra['Alexander_2016'],
+        nwalkers=nwalkers,
+        nsteps=nsteps,
+        vectorize=vectorize,
+        **storage,
+    )
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fit.do_fit(plot=plot)
+    matplotlib.pyplot.close('all')
+    return fit
+
+
+def bench_do_fit(sizes):
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # do_fit writes its PDFs to the working directory:
+        os.chdir(tmp)
+        try:
+            for nwalkers, nsteps in sizes:
+                for vectorize in (False, True):
+                    key = f'do_fit.{nwalkers}x{nsteps}'
+                    if vectorize:
+                        key += '.batched'
+                    results[f'{key}.seconds'] = best_of(
+                        lambda: run_fit(nwalkers, nsteps, vectorize), 1
+                    )
+                    # tracemalloc slows the fit down, so memory gets its own run:
+                    tracemalloc.start()
+                    run_fit(nwalkers, nsteps, vectorize)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    results[f'{key}.peak_mb'] = peak / 1024 ** 2
+                    tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+# chain storage policies (TDE_fit arguments) for the storage benchmarks:
+STORAGE_POLICIES = {
+    'float64': {},
+    'float32': dict(chain_dtype=np.float32),
+    'compact': dict(chain_dtype=np.float32, store_log_prob=False, drop_burnin=True),
+}
+
+
+def bench_storage(sizes):
+    """ Megabytes of chain and log-probabilities stored by the sampler for each storage policy (the same as the chain_file size on disk). """
+    results = {}
+    for nwalkers, nsteps in sizes:
+        for policy, storage in STORAGE_POLICIES.items():
+            backend = run_fit(
+                nwalkers, nsteps, vectorize=True, plot=False, **storage
+            ).sampler.backend
+            nbytes = backend.chain.nbytes
+            if backend.store_log_prob:
+                nbytes += backend.log_prob.nbytes
+            results[f'storage.{nwalkers}x{nsteps}.{policy}.mb'] = nbytes / 1024 ** 2
+    return results
+
+
+def fit_spectrum(spectrum, **kwargs):
+    np.random.seed(42)
+    fit = TDE_fit(**spectrum, **kwargs)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fit.do_fit(plot=False)
+    return fit
+
+
+def bench_grid(sizes):
+    """ Wall time and number of model spectra of the grid backend and of emcee, and the largest offset between their medians of Fvb, vb and p in units of the emcee 1 sigma, for each example spectrum. """
+    results = {}
+    for spectrum_name, spectrum in reference_spectra.items():
+        start = time.perf_counter()
+        grid = fit_spectrum(spectrum, backend=GridBackend())
+        results[f'grid.{spectrum_name}.seconds'] = time.perf_counter() - start
+        results[f'grid.{spectrum_name}.models'] = grid.sampler.nmodels
+        for nwalkers, nsteps in sizes:
+            key = f'grid.{spectrum_name}.emcee_{nwalkers}x{nsteps}'
+            start = time.perf_counter()
+            fit = fit_spectrum(
+                spectrum, nwalkers=nwalkers, nsteps=nsteps, vectorize=True
+            )
+            results[f'{key}.seconds'] = time.perf_counter() - start
+            results[f'{key}.models'] = nwalkers * (nsteps + 1)
+            offsets = [
+                abs(grid.summary[k] - fit.summary[k]) / fit.summary[f'{k}_u']
+                for k in ('Fvb', 'vb', 'p')
+            ]
+            results[f'{key}.offset_sigma'] = max(offsets)
+    return results
+
+
+def bench_sem(nsamples=100000, repeat=15):
+    rng = np.random.default_rng(0)
+    vp = rng.normal(3.6, 0.3, nsamples)
+    Fvp = rng.normal(1.15, 0.1, nsamples)
+    p = rng.normal(2.8, 0.1, nsamples)
+
+    def analysis():
+        sem = SEM(vp=vp, Fvp=Fvp, p=p, dL=90, z=0.0206, t=246)
+        Req = sem.get_Req()
+        Eeq = sem.get_Eeq()
+        Ne = sem.get_Ne(Req)
+        sem.get_ambientden(Ne, Req)
+        beta_ej = sem.get_outflow_velocity(Req)
+        sem.get_outflow_mass(Eeq, beta_ej)
+        sem.get_Bfield(Req)
+
+    with np.errstate(all='ignore'):
+        seconds = best_of(analysis, repeat)
+    return {'sem.samples_per_second': nsamples / seconds}
+
+
+def higher_is_better(key):
+    return key.endswith('per_second')
+
+
+# accuracy metrics, which may grow by this much over their baseline (a relative
+# threshold would flag 0.04 -> 0.05 sigma):
+ABSOLUTE_TOLERANCES = {'offset_sigma': 0.2}
+
+
+def compare(results, baselines, threshold):
+    """ Return a list of (key, value, baseline, change) for metrics more than threshold (a fraction) worse than their baseline, or, for the metrics in ABSOLUTE_TOLERANCES, more than their tolerance above it. """
+    regressions = []
+    for key, value in results.items():
+        if key not in baselines:
+            continue
+        baseline = baselines[key]
+        change = value / baseline - 1 if baseline else np.inf
+        tolerance = ABSOLUTE_TOLERANCES.get(key.rsplit('.', 1)[-1])
+        if tolerance is not None:
+            regressed = value - baseline > tolerance
+        else:
+            worse = -change if higher_is_better(key) else change
+            regressed = worse > threshold
+        if regressed:
+            regressions.append((key, value, baseline, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--quick', action='store_true', help='only run the smallest do_fit size'
+    )
+    parser.add_argument(
+        '--save', action='store_true', help='store the results as the new baselines'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='allowed fractional slow down before failing (default 0.25)',
+    )
+    parser.add_argument('--baselines', default=BASELINES, help='baselines JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    results.update(bench_likelihood())
+    results.update(bench_sem())
+    results.update(bench_do_fit(QUICK_FIT_SIZES if args.quick else FIT_SIZES))
+    results.update(bench_storage(QUICK_FIT_SIZES if args.quick else FIT_SIZES))
+    results.update(
+        bench_grid(QUICK_GRID_EMCEE_SIZES if args.quick else GRID_EMCEE_SIZES)
+    )
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+
+    for key, value in sorted(results.items()):
+        baseline = baselines.get(key)
+        change = f'{100 * (value / baseline - 1):+7.1f}%' if baseline else ''
+        print(f'{key:<70} {value:12.4g} {change}')
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'Saved baselines to {args.baselines}')
+        return 0
+
+    regressions = compare(results, baselines, args.threshold)
+    for key, value, baseline, change in regressions:
+        print(
+            f'**regression** {key}: {value:.4g} vs baseline {baseline:.4g} '
+            f'({100 * change:+.1f}%)'
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -37,6 +37,12 @@ setup(
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ],
+    entry_points={
+        'console_scripts': [
+            'tde-spectra-fit=tde_spectra_fit.cli:main',
+            'tde-spectra-fit-service=tde_spectra_fit.service:main',
+        ],
+    },
     description="Package to fit TDE radio spectra to determine the spectral index, p, and the peak flux desnity and frequency of the spectrum",
     install_requires=requirements,
     license="MIT license",
@@ -1,7 +1,7 @@
 """ synchrotron emission model from Barniol and Duran (2013) """
+from contextlib import nullcontext
+
 import numpy as np
-from sympy import solve
-from sympy import symbols
 
 
 class SEM:
@@ -20,6 +20,7 @@ class SEM:
         vm=None,
         save=False,
         name=None,
+        profile=None,
     ):
         """ 
         This class calculates physical TDE system parameters from observed parameters from radio spectral observations. It uses the equations from Barniol and Duran (2013).
@@ -37,6 +38,7 @@ class SEM:
             - va and vm only requred if va_gtr_vm = False
             - save: option to write parameters to text file 
             - name: str, name for text file, only required if save = True
+            - profile: None or the FitProfile of the TDE_fit run that measured vp, Fvp and p (e.g. TDE_fit(profile=True).profile), to add the time spent in do_analysis to that run's profile report
         """
 
         # constants and conversions
@@ -57,12 +59,13 @@ class SEM:
         self.vp = vp  # GHz
         self.Fvp = Fvp  # mJy
         self.d = dL * Mpctocm  # cm
-        self.z = 0.0206
+        self.z = z
         self.t = t * 24 * 60 * 60
         self.geo = geo
         self.save = save
         self.name = name
         self.p = p
+        self.profile = profile
 
         if va_gtr_vm:
             self.eta = 1.0
@@ -189,9 +192,8 @@ class SEM:
 
     def get_outflow_velocity(self, Req):
         fac = Req * (1 + self.z) / (self.c * self.t)
-        x = symbols('x')
-        res = solve(x / (1 - x) - fac, x)
-        beta_ej = res[0]
+        # solution of beta / (1 - beta) = fac, in closed form so that arrays of Req work:
+        beta_ej = fac / (1 + fac)
 
         return beta_ej
 
@@ -202,13 +204,14 @@ class SEM:
 
     def do_analysis(self):
 
-        Req = self.get_Req()
-        Eeq = self.get_Eeq()
-        Ne = self.get_Ne(Req)
-        ne = self.get_ambientden(Ne, Req)
-        beta_ej = self.get_outflow_velocity(Req)
-        M_ej = self.get_outflow_mass(Eeq, beta_ej)
-        B = self.get_Bfield(Req)
+        with self.profile.stage('sem') if self.profile is not None else nullcontext():
+            Req = self.get_Req()
+            Eeq = self.get_Eeq()
+            Ne = self.get_Ne(Req)
+            ne = self.get_ambientden(Ne, Req)
+            beta_ej = self.get_outflow_velocity(Req)
+            M_ej = self.get_outflow_mass(Eeq, beta_ej)
+            B = self.get_Bfield(Req)
 
         print(f'Assuming ' + self.geo + ' geometry..')
         print(f'At time t = {self.t/(24*60*60)} d')
@@ -225,12 +228,28 @@ class SEM:
         print(f'Magnetic field: {B} G')
         print('--------------------------------------------------')
 
+        self.results = dict(
+            t=self.t / (24 * 60 * 60),
+            Req=Req,
+            Eeq=Eeq,
+            beta_ej=beta_ej,
+            M_ej=M_ej,
+            ne=ne,
+            B=B,
+            Ne=Ne,
+        )
+
         if self.save:
             print('Writing to text file ' + self.name + '.txt..')
+            # one row per value of the (possibly array) inputs, columns in header order:
+            columns = [self.t / (24 * 60 * 60), Req, Eeq, beta_ej, M_ej, ne, B, Ne]
             np.savetxt(
                 self.name + '.txt',
-                [self.t, Req, Eeq, beta_ej, M_ej, B, Ne],
-                header='t (d), Req (cm), Eeq (erg), velocity (c), Mass (g), Ambient density (cm^-3), B field (G), electron density',
+                np.column_stack(np.broadcast_arrays(*columns)),
+                header='t (d), Req (cm), Eeq (erg), velocity (c), Mass (g), Ambient density (cm^-3), B field (G), number of electrons',
             )
 
+        if self.profile is not None:
+            print(f'Writing profile to {self.profile.write(self.profile.path)}')
+
         return Eeq, Req
@@ -0,0 +1,163 @@
+""" Storage of emcee chains: compact and on-disk backends, so long runs need not hold the chain in memory, and the stand-in chain of backends that draw independent samples """
+import os
+
+import emcee
+import numpy as np
+
+
+def log_prob_path(chain_file):
+    root, ext = os.path.splitext(chain_file)
+    return f'{root}_log_prob{ext or ".npy"}'
+
+
+class IndependentDraws:
+    def __init__(self, samples):
+        """ Independent posterior draws, shape (nsamples, 4), exposing the parts of the emcee.EnsembleSampler interface that do_fit uses. Base class of the results of the backends that do not run a Markov chain (samplers.LaplaceResult, grid.GridResult). """
+        self.samples = samples
+        self.acceptance_fraction = np.ones(1)
+
+    def get_chain(self, discard=0, thin=1, flat=False):
+        # draws are independent, so there is no burn-in to discard or correlation to thin:
+        if flat:
+            return self.samples
+        return self.samples[:, None, :]
+
+    def get_autocorr_time(self):
+        return np.ones(self.samples.shape[1])
+
+
+class CompactBackend(emcee.backends.Backend):
+    def __init__(self, dtype=None, store_log_prob=True, discard=0, store_chain=True):
+        """ In-memory emcee backend with a storage policy, to cut the memory (and disk, see MemmapBackend) taken by long runs.
+
+        Parameters:
+        dtype: numpy dtype of the stored positions and log-probabilities, default float64. float32 keeps ~7 significant digits, ample for Fvb, vb, p and log_f, in half the space.
+        store_log_prob: True or False, set False to not keep the log-probability of every step (only the last step's, to continue the run)
+        discard: integer, number of initial (burn-in) steps that are not stored at all. The stored chain then starts at step discard, so read it back with get_chain(discard=0).
+        store_chain: True or False, set False to store no steps at all, only count the acceptances (and keep the last step, to continue the run)
+
+        Blobs are not supported. The acceptance fraction is that of the steps after discard.
+        """
+        super().__init__(dtype=dtype)
+        self.store_log_prob = store_log_prob
+        self.discard = discard
+        self.store_chain = store_chain
+
+    def reset(self, nwalkers, ndim):
+        super().reset(nwalkers, ndim)
+        # acceptance counts, kept in float64 whatever the dtype of the samples:
+        self.accepted = np.zeros(self.nwalkers)
+        self.nskipped = 0
+        self.last_coords = None
+        self.last_log_prob = None
+
+    def nstored(self, ngrow):
+        """ Number of the next ngrow steps that will be stored. """
+        if not self.store_chain:
+            return 0
+        return ngrow - max(0, self.discard - self.nskipped)
+
+    def grow(self, ngrow, blobs):
+        self._check_blobs(blobs)
+        if blobs is not None:
+            raise ValueError(f'{type(self).__name__} does not store blobs')
+        i = self.nstored(ngrow) - (len(self.chain) - self.iteration)
+        if i <= 0:
+            return
+        a = np.empty((i, self.nwalkers, self.ndim), dtype=self.dtype)
+        self.chain = np.concatenate((self.chain, a), axis=0)
+        if self.store_log_prob:
+            a = np.empty((i, self.nwalkers), dtype=self.dtype)
+            self.log_prob = np.concatenate((self.log_prob, a), axis=0)
+
+    def save_step(self, state, accepted):
+        self._check(state, accepted)
+        self.last_coords = state.coords
+        self.last_log_prob = state.log_prob
+        self.random_state = state.random_state
+        if self.nskipped < self.discard:
+            self.nskipped += 1
+            return
+        if self.store_chain:
+            self.chain[self.iteration] = state.coords
+            if self.store_log_prob:
+                self.log_prob[self.iteration] = state.log_prob
+        self.accepted += accepted
+        self.iteration += 1
+
+    def get_value(self, name, **kwargs):
+        if name in ('chain', 'log_prob') and not self.store_chain:
+            raise AttributeError('the chain was not stored (store_chain=False)')
+        if name == 'log_prob' and not self.store_log_prob:
+            raise AttributeError(
+                'the log-probabilities were not stored (store_log_prob=False)'
+            )
+        return super().get_value(name, **kwargs)
+
+    def get_last_sample(self):
+        if self.iteration <= 0:
+            return super().get_last_sample()
+        return emcee.State(
+            self.last_coords,
+            log_prob=self.last_log_prob,
+            random_state=self.random_state,
+        )
+
+
+class MemmapBackend(CompactBackend):
+    def __init__(self, chain_file, dtype=None, store_log_prob=True, discard=0):
+        """ emcee backend that keeps the chain and log-probabilities in .npy files, memory mapped, instead of in memory.
+
+        Parameters:
+        chain_file: string, .npy file for the chain, of shape (nsteps, nwalkers, ndim). The log-probabilities, of shape (nsteps, nwalkers), go to the same name with a _log_prob suffix.
+        dtype, store_log_prob, discard: storage policy, see CompactBackend
+
+        Blobs are not supported. Reopen a finished chain with load_chain.
+        """
+        super().__init__(dtype=dtype, store_log_prob=store_log_prob, discard=discard)
+        self.chain_file = chain_file
+
+    def reset(self, nwalkers, ndim):
+        super().reset(nwalkers, ndim)
+        # so that load_chain does not pick up the log-probabilities of an earlier run:
+        if not self.store_log_prob and os.path.exists(log_prob_path(self.chain_file)):
+            os.remove(log_prob_path(self.chain_file))
+
+    def grow(self, ngrow, blobs):
+        self._check_blobs(blobs)
+        if blobs is not None:
+            raise ValueError('MemmapBackend does not store blobs')
+        nsteps = self.iteration + self.nstored(ngrow)
+        if len(self.chain) >= nsteps:
+            return
+        self.chain = self._grow_file(
+            self.chain_file, self.chain, (nsteps, self.nwalkers, self.ndim)
+        )
+        if self.store_log_prob:
+            self.log_prob = self._grow_file(
+                log_prob_path(self.chain_file), self.log_prob, (nsteps, self.nwalkers)
+            )
+
+    def _grow_file(self, path, old, shape):
+        # write the longer array next to the old one, then swap it in:
+        tmp = path + '.tmp'
+        new = np.lib.format.open_memmap(tmp, mode='w+', dtype=self.dtype, shape=shape)
+        new[: self.iteration] = old[: self.iteration]
+        new.flush()
+        del old, new
+        os.replace(tmp, path)
+        return np.load(path, mmap_mode='r+')
+
+    def flush(self):
+        """ Write the stored steps to disk. """
+        for array in (self.chain, self.log_prob):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+def load_chain(chain_file):
+    """ Memory map a chain written by MemmapBackend, returns the chain of shape (nsteps, nwalkers, ndim) and the log-probabilities of shape (nsteps, nwalkers), or None if they were not stored. Steps not reached by the run are left as written by numpy (zeros). """
+    log_prob_file = log_prob_path(chain_file)
+    if not os.path.exists(log_prob_file):
+        return np.load(chain_file, mmap_mode='r'), None
+    return np.load(chain_file, mmap_mode='r'), np.load(log_prob_file, mmap_mode='r')
@@ -0,0 +1,349 @@
+""" Command line entry point, tde-spectra-fit, to fit batches of spectra read from CSV/ECSV files without Jupyter """
+import argparse
+import contextlib
+import csv
+import json
+import math
+import os
+import re
+import sys
+from multiprocessing import Pool
+
+import matplotlib
+
+# headless: no display is needed, or available on cluster nodes
+matplotlib.use('Agg')
+
+import numpy as np  # noqa: E402
+
+from tde_spectra_fit.replicas import ReplicaBackend  # noqa: E402
+from tde_spectra_fit.samplers import LaplaceBackend  # noqa: E402
+from tde_spectra_fit.SEM import SEM  # noqa: E402
+from tde_spectra_fit.store import (  # noqa: E402
+    ResultsStore,
+    fit_result,
+    posterior_samples,
+    save_samples,
+)
+from tde_spectra_fit.tde_spectra_fit import TDE_fit  # noqa: E402
+
+# accepted column names in spectrum files, for each TDE_fit argument:
+columns = {
+    'frequency': ('frequency', 'freq', 'nu'),
+    'fd': ('fd', 'flux', 'flux_density'),
+    'fd_err_low': ('fd_err_low', 'flux_err_low', 'err_low'),
+    'fd_err_up': ('fd_err_up', 'flux_err_up', 'err_up'),
+    'fd_err': ('fd_err', 'flux_err', 'err'),
+    'quiescent_flux_density': ('quiescent_flux_density', 'quiescent'),
+}
+
+# columns of the results table, the same keys are written as newline-delimited JSON:
+table_columns = ('name', 'Fvb', 'vb', 'p', 'Fp', 'vp', 'Fvb_u', 'vb_u', 'p_u', 'Fp_u')
+
+
+def read_table(path):
+    """ Read a CSV or ECSV file into a dictionary of column name to list of strings. ECSV files are read with the delimiter from their YAML header (space by default), other files as comma separated. Lines starting with # are skipped. """
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    delimiter = ','
+    if path.endswith('.ecsv'):
+        delimiter = ' '
+        for line in lines:
+            match = re.match(r"^#\s*delimiter:\s*'?([^']+?)'?\s*$", line)
+            if match:
+                delimiter = match.group(1)
+
+    rows = [line for line in lines if line.strip() and not line.startswith('#')]
+    reader = csv.reader(rows, delimiter=delimiter, skipinitialspace=True)
+    header = [name.strip().lower() for name in next(reader)]
+    table = {name: [] for name in header}
+    for row in reader:
+        for name, value in zip(header, row):
+            table[name].append(value.strip())
+    return table
+
+
+def read_spectrum(path):
+    """ Read a spectrum file with frequency (GHz), flux density, lower and upper flux density errors (or a single symmetric error) and, optionally, quiescent flux density (mJy) columns. Returns a dictionary of TDE_fit keyword arguments. """
+    table = read_table(path)
+
+    spectrum = {}
+    for argument, names in columns.items():
+        for name in names:
+            if name in table:
+                spectrum[argument] = np.array(table[name], dtype=float)
+                break
+
+    if 'fd_err' in spectrum:
+        err = spectrum.pop('fd_err')
+        spectrum.setdefault('fd_err_low', err)
+        spectrum.setdefault('fd_err_up', err)
+    required = ('frequency', 'fd', 'fd_err_low', 'fd_err_up')
+    missing = [a for a in required if a not in spectrum]
+    if missing:
+        raise ValueError(f'{path} has no column for {", ".join(missing)}')
+
+    spectrum['name'] = os.path.splitext(os.path.basename(path))[0]
+    return spectrum
+
+
+# optional per-spectrum columns of a CSV manifest:
+manifest_columns = (
+    ('break_number', int),
+    ('dL', float),
+    ('z', float),
+    ('t', float),
+    ('epoch', float),
+)
+
+
+def read_manifest(path):
+    """ Read a manifest of spectrum files, one job per spectrum. The manifest is either a list of paths, one per line, or a CSV file with a path column and optional name, source, epoch, break_number, dL, z and t columns overriding the command line options for that spectrum. Relative paths are relative to the manifest. """
+    root = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        first = next(
+            (line for line in f if line.strip() and not line.startswith('#')), ''
+        )
+
+    if 'path' in [name.strip().lower() for name in first.split(',')]:
+        table = read_table(path)
+        jobs = [
+            {name: values[i] for name, values in table.items()}
+            for i in range(len(table['path']))
+        ]
+    else:
+        with open(path) as f:
+            jobs = [
+                {'path': line.strip()}
+                for line in f
+                if line.strip() and not line.startswith('#')
+            ]
+
+    for job in jobs:
+        job['path'] = os.path.join(root, job['path'])
+        for key, cast in manifest_columns:
+            if job.get(key):
+                job[key] = cast(job[key])
+            else:
+                job.pop(key, None)
+    return jobs
+
+
+def run_fit(spectrum, job, callback=None):
+    """ Fit a spectrum, a dictionary of TDE_fit keyword arguments, with the options of job (and optionally run the SEM analysis on the fit). Returns a dictionary of results. callback is passed on to TDE_fit to follow the sampler. The fit's printed output goes to stderr so that stdout only carries results. """
+    backend = job['backend']
+    if job['seed'] is not None:
+        np.random.seed(job['seed'])
+        if backend == 'laplace':
+            backend = LaplaceBackend(seed=job['seed'])
+    if backend == 'replicas':
+        backend = ReplicaBackend(nreplicas=job['replicas'], seed=job['seed'])
+    fit = TDE_fit(
+        **spectrum,
+        break_number=job['break_number'],
+        nsteps=job['nsteps'],
+        nwalkers=job['nwalkers'],
+        backend=backend,
+        moves=job['moves'],
+        vectorize=job['vectorize'],
+        callback=callback,
+    )
+    sem = None
+    with contextlib.redirect_stdout(sys.stderr):
+        fit.do_fit(plot=job['plot'])
+        matplotlib.pyplot.close('all')
+
+        if job['sem']:
+            sem = SEM(
+                vp=fit.summary['vp'],
+                Fvp=fit.summary['Fp'],
+                p=fit.summary['p'],
+                dL=job['dL'],
+                z=job['z'],
+                t=job['t'],
+                geo=job['geo'],
+            )
+            sem.do_analysis()
+
+    result = fit_result(fit, sem, source=job.get('source'), epoch=job.get('epoch'))
+    if job.get('samples_dir'):
+        samples = posterior_samples(fit)
+        if samples is not None:
+            result['samples'] = save_samples(job['samples_dir'], samples)
+    return result
+
+
+def fit_spectrum(job):
+    """ Read and fit the spectrum file of one job, see run_fit. Runs in a worker process; errors are returned in the results rather than raised. """
+    result = {'file': job['path']}
+    try:
+        spectrum = read_spectrum(job['path'])
+        if job.get('name'):
+            spectrum['name'] = job['name']
+        result['name'] = spectrum['name']
+        result.update(run_fit(spectrum, job))
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def run_jobs(jobs, workers):
+    """ Yield fit results as each job finishes, on a pool of worker processes. """
+    if workers == 1:
+        yield from map(fit_spectrum, jobs)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(fit_spectrum, jobs)
+
+
+def to_json(value):
+    """ Convert numpy values to plain python for json, with nan and infinity as null. """
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(v) for v in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    return value
+
+
+def format_row(result):
+    if 'error' in result:
+        name = result.get('name', result['file'])
+        return f'{name:<24} **error** {result["error"]}'
+    cells = [f'{result["name"]:<24}']
+    cells += [f'{result[c]:>9.4g}' for c in table_columns[1:]]
+    return ' '.join(cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='tde-spectra-fit',
+        description='Fit broken powerlaws to radio TDE spectra read from CSV/ECSV files.',
+    )
+    parser.add_argument(
+        'spectra',
+        nargs='*',
+        help='spectrum files with frequency (GHz), flux, err_low, err_up and optional '
+        'quiescent (mJy) columns',
+    )
+    parser.add_argument(
+        '-m', '--manifest', help='file listing spectrum files, see read_manifest'
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int, default=1, help='number of worker processes'
+    )
+    parser.add_argument('--nwalkers', type=int, default=400)
+    parser.add_argument('--nsteps', type=int, default=10000)
+    parser.add_argument(
+        '-b', '--break-number', type=int, default=5, help='Granot & Sari 2002 break'
+    )
+    parser.add_argument(
+        '--backend', default='emcee', choices=('emcee', 'laplace', 'replicas', 'grid')
+    )
+    parser.add_argument(
+        '--replicas',
+        type=int,
+        default=4,
+        help='number of independent ensembles for --backend replicas',
+    )
+    parser.add_argument(
+        '--moves', default=None, help="emcee move mix, e.g. 'de:0.8,desnooker:0.2'"
+    )
+    parser.add_argument(
+        '--vectorize', action='store_true', help='batched likelihood evaluation'
+    )
+    parser.add_argument('--seed', type=int, default=None, help='random seed per fit')
+    parser.add_argument(
+        '--plot', action='store_true', help='write the {name}_*.pdf figures'
+    )
+    parser.add_argument(
+        '--sem', action='store_true', help='run the SEM analysis on each fit'
+    )
+    parser.add_argument(
+        '--dL', type=float, default=90, help='luminosity distance for --sem (Mpc)'
+    )
+    parser.add_argument('--z', type=float, default=0.0206, help='redshift for --sem')
+    parser.add_argument(
+        '--t', type=float, default=246, help='days since launch for --sem'
+    )
+    parser.add_argument('--geo', default='spherical', choices=('spherical', 'conical'))
+    parser.add_argument(
+        '-f', '--format', default='ndjson', choices=('ndjson', 'table')
+    )
+    parser.add_argument(
+        '-o', '--output', default=None, help='output file (default stdout)'
+    )
+    parser.add_argument(
+        '--store',
+        default=None,
+        help='also add the results and posterior samples to this SQLite catalogue, '
+        'see store.py',
+    )
+    args = parser.parse_args(argv)
+
+    jobs = [{'path': path} for path in args.spectra]
+    if args.manifest:
+        jobs += read_manifest(args.manifest)
+    if not jobs:
+        parser.error('no spectra given')
+
+    options = dict(
+        break_number=args.break_number,
+        nsteps=args.nsteps,
+        nwalkers=args.nwalkers,
+        backend=args.backend,
+        replicas=args.replicas,
+        moves=args.moves,
+        vectorize=args.vectorize,
+        seed=args.seed,
+        plot=args.plot,
+        sem=args.sem,
+        dL=args.dL,
+        z=args.z,
+        t=args.t,
+        geo=args.geo,
+    )
+    store = None
+    if args.store:
+        store = ResultsStore(args.store)
+        options['samples_dir'] = store.samples_dir
+    # manifest columns take precedence over the command line:
+    jobs = [{**options, **job} for job in jobs]
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    nfailed = 0
+    pending = []
+    try:
+        if args.format == 'table':
+            header = [f'{"name":<24}'] + [f'{c:>9}' for c in table_columns[1:]]
+            print(' '.join(header), file=out)
+
+        for result in run_jobs(jobs, args.workers):
+            nfailed += 'error' in result
+            if args.format == 'table':
+                print(format_row(result), file=out)
+            else:
+                print(json.dumps(to_json(result)), file=out)
+            out.flush()
+            if store is not None:
+                # add results to the catalogue in batches, one transaction each:
+                pending.append(result)
+                if len(pending) >= 50:
+                    store.insert(pending)
+                    pending = []
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.insert(pending)
+            store.close()
+
+    return 1 if nfailed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
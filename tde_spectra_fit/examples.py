@@ -0,0 +1,36 @@
+""" Example radio TDE spectra bundled with the package, stored as keyword arguments for TDE_fit """
+import numpy as np
+
+from tde_spectra_fit import tde_spectra_fit
+
+# default spectrum of TDE_fit, the example data of tde_spectra_fit.py:
+high_sparrow = dict(
+    fd=tde_spectra_fit.flux_density,
+    fd_err_low=tde_spectra_fit.u_flux_density_low,
+    fd_err_up=tde_spectra_fit.u_flux_density_up,
+    frequency=tde_spectra_fit.frequency,
+    name='High_Sparrow_Oct2020',
+)
+
+# ASASSN-14li at 246 days, from Alexander et al 2016 (see the example notebook):
+_frequency = np.array(
+    [1.4, 1.5, 1.8, 2.6, 3.4, 5.0, 7.1, 8.5, 11.0, 13.5, 16.0, 19.2, 24.5]
+)  # GHz
+_u_flux_density = np.array(
+    [0.08, 0.10, 0.09, 0.05, 0.03, 0.03, 0.03, 0.02, 0.04, 0.02, 0.02, 0.09, 0.04]
+)  # mJy
+alexander_2016 = dict(
+    fd=np.array(
+        [2.18, 2.12, 2.13, 2.00, 1.84, 1.56, 1.26, 1.06, 0.84, 0.73, 0.59, 0.44, 0.30]
+    ),  # mJy
+    fd_err_low=_u_flux_density,
+    fd_err_up=_u_flux_density,
+    frequency=_frequency,
+    quiescent_flux_density=1.8 * (_frequency / 1.4) ** (-1),  # mJy
+    name='Alexander_2016',
+)
+
+reference_spectra = {
+    'High_Sparrow_Oct2020': high_sparrow,
+    'Alexander_2016': alexander_2016,
+}
@@ -0,0 +1,212 @@
+""" Deterministic grid posterior: the likelihood evaluated on a progressively refined grid in Fvb, vb, p and log_f, in place of MCMC sampling. With three spectral parameters and a fixed prior box, a few hundred thousand broadcast model evaluations map the whole posterior """
+import numpy as np
+from scipy.special import logsumexp
+
+from tde_spectra_fit.chains import IndependentDraws
+from tde_spectra_fit.likelihood import powerlaw, prior_bounds
+from tde_spectra_fit.summaries import spectral_peak
+
+# Fvb and vb span decades, so their grids are spaced logarithmically:
+log_spaced = (True, True, False, False)
+
+
+def grid_edges(lo, hi, n, log):
+    return np.geomspace(lo, hi, n + 1) if log else np.linspace(lo, hi, n + 1)
+
+
+def cell_centres(edges, log):
+    if log:
+        return np.sqrt(edges[1:] * edges[:-1])
+    return (edges[1:] + edges[:-1]) / 2
+
+
+def log_likelihood_grid(
+    centres, x, y, yerr, break_number, chunk_size=2048, counter=None
+):
+    """ log_likelihood on the grid spanned by centres, the grid points of (Fvb, vb, p, log_f), returns shape (nFvb, nvb, np, nlog_f). The model spectrum is computed once for each (Fvb, vb, p) and broadcast over all log_f, chunk_size points at a time. counter, a list, is incremented by the number of model spectra computed. """
+    yerrup = yerr[1]
+    yerrlow = yerr[0]
+    Fvb, vb, p = (a.ravel() for a in np.meshgrid(*centres[:3], indexing='ij'))
+    scale = np.exp(2 * centres[3])[:, None]
+    log_like = np.empty((len(Fvb), len(scale)))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for start in range(0, len(Fvb), chunk_size):
+            s = slice(start, start + chunk_size)
+            model = powerlaw(x, Fvb[s, None], vb[s, None], p[s, None], break_number)
+            # shape (chunk, nlog_f, ndata), as in log_likelihood:
+            m2 = model[:, None, :] ** 2 * scale
+            sigma2 = (yerrup ** 2 + m2) + (yerrlow ** 2 + m2) / 2
+            log_like[s] = -0.5 * np.sum(
+                (y - model)[:, None, :] ** 2 / sigma2 + np.log(sigma2), axis=-1
+            )
+    if counter is not None:
+        counter[0] += len(Fvb)
+    log_like[~np.isfinite(log_like)] = -np.inf
+    return log_like.reshape(tuple(len(c) for c in centres))
+
+
+def log_cell_volume(edges):
+    """ Log of the volume of each grid cell in (Fvb, vb, p, log_f), in which the prior is uniform. """
+    widths = np.meshgrid(*(np.log(np.diff(e)) for e in edges), indexing='ij')
+    return sum(widths)
+
+
+def refine_bounds(edges, log_mass, delta):
+    """ Bounds of the box holding every cell with log_mass within delta of the largest, padded by one cell on each side. """
+    keep = log_mass > np.max(log_mass) - delta
+    bounds = []
+    for axis, e in enumerate(edges):
+        other = tuple(a for a in range(len(edges)) if a != axis)
+        inside = np.flatnonzero(np.any(keep, axis=other))
+        bounds.append((e[max(inside[0] - 1, 0)], e[min(inside[-1] + 2, len(e) - 1)]))
+    return bounds
+
+
+def width(bounds, log):
+    lo, hi = bounds
+    return np.log(hi / lo) if log else hi - lo
+
+
+class GridResult(IndependentDraws):
+    def __init__(
+        self, edges, log_like, log_mass, samples, break_number, nlevels, nmodels
+    ):
+        """ Posterior on the final grid of GridBackend, with independent draws from it (see chains.IndependentDraws).
+
+        Parameters:
+        edges: list of 4 arrays, cell edges of the grid in Fvb, vb, p and log_f
+        log_like: array of shape (nFvb, nvb, np, nlog_f), log-likelihood at the cell centres
+        log_mass: array of the same shape, log posterior probability of each cell, normalised over the grid
+        samples: array of shape (nsamples, 4), posterior draws of Fvb, vb, p, log_f
+        break_number: integer, spectral break of the model, for the peak statistics of the draws
+        nlevels: integer, number of grids evaluated, the last one being the final grid
+        nmodels: integer, number of model spectra computed, over all grids
+
+        """
+        super().__init__(samples)
+        self.edges = edges
+        self.centres = [cell_centres(e, log) for e, log in zip(edges, log_spaced)]
+        self.log_like = log_like
+        self.log_mass = log_mass
+        self.break_number = break_number
+        self.nlevels = nlevels
+        self.nmodels = nmodels
+
+        best = np.unravel_index(np.argmax(log_like), log_like.shape)
+        self.theta_map = np.array([c[i] for c, i in zip(self.centres, best)])
+        self.log_prob_map = log_like[best]
+
+        # evidence of the break model over the prior box, the grid holding all the mass:
+        log_prior_volume = sum(np.log(width(b, False)) for b in prior_bounds)
+        self.log_evidence = logsumexp(
+            log_like + log_cell_volume(edges) - log_prior_volume
+        )
+
+        vp, Fp = spectral_peak(samples, self.break_number)
+        self.diagnostics = dict(
+            grid_shape=list(log_like.shape),
+            grid_levels=nlevels,
+            grid_models=nmodels,
+            log_evidence=self.log_evidence,
+            vp_percentiles=np.percentile(vp, [16, 50, 84]).tolist(),
+            Fp_percentiles=np.percentile(Fp, [16, 50, 84]).tolist(),
+        )
+
+    def marginal(self, i):
+        """ Cell edges and posterior probability of each cell of parameter i (0-3 for Fvb, vb, p, log_f), marginalised over the others. """
+        other = tuple(a for a in range(4) if a != i)
+        return self.edges[i], np.exp(logsumexp(self.log_mass, axis=other))
+
+    def joint(self, i, j):
+        """ Cell edges of parameters i and j and their joint posterior probability, shape (len(edges i) - 1, len(edges j) - 1), marginalised over the other two. """
+        other = tuple(a for a in range(4) if a not in (i, j))
+        mass = np.exp(logsumexp(self.log_mass, axis=other))
+        return self.edges[i], self.edges[j], mass if i < j else mass.T
+
+
+class GridBackend:
+    """ Deterministic grid backend for TDE_fit. The log-likelihood is evaluated on a grid covering the prior box, with npoints cells in each of Fvb, vb and p (logarithmic in Fvb and vb) and nlog_f in log_f. The grid is then shrunk to the box holding all cells within delta of the most probable one and evaluated again, until the box stops shrinking by more than tol or max_levels grids have been evaluated. log_f is marginalised numerically on its grid: the model spectrum of each (Fvb, vb, p) is computed once and broadcast over all log_f. do_fit summarises nsamples draws from the final grid, each drawn uniformly within its cell. A mode narrower than a cell of the first grid and less probable than the best cell there can be missed.
+
+    Parameters:
+    npoints: integer, number of cells in each of Fvb, vb and p
+    nlog_f: integer, number of cells in log_f
+    delta: float, cells with a log posterior probability within delta of the largest are kept when refining
+    tol: float, refinement stops once no axis of the box shrinks by more than this fraction
+    max_levels: integer, maximum number of grids evaluated
+    chunk_size: integer, number of (Fvb, vb, p) points evaluated at a time, bounding memory use
+    nsamples: integer, number of draws from the final grid
+    seed: integer or None, seed for the draws, fixed by default so that fits are reproducible
+
+    """
+
+    name = 'grid'
+
+    def __init__(
+        self,
+        npoints=40,
+        nlog_f=40,
+        delta=20.0,
+        tol=0.1,
+        max_levels=8,
+        chunk_size=2048,
+        nsamples=20000,
+        seed=0,
+    ):
+        self.npoints = npoints
+        self.nlog_f = nlog_f
+        self.delta = delta
+        self.tol = tol
+        self.max_levels = max_levels
+        self.chunk_size = chunk_size
+        self.nsamples = nsamples
+        self.seed = seed
+
+    def run(self, fit):
+        x = fit.frequency
+        y = fit.flux_emission
+        yerr = [fit.fd_err_low, fit.fd_err_up]
+        shape = (self.npoints,) * 3 + (self.nlog_f,)
+        nmodels = [0]
+
+        bounds = list(prior_bounds)
+        for level in range(1, self.max_levels + 1):
+            edges = [
+                grid_edges(lo, hi, n, log)
+                for (lo, hi), n, log in zip(bounds, shape, log_spaced)
+            ]
+            centres = [cell_centres(e, log) for e, log in zip(edges, log_spaced)]
+            log_like = log_likelihood_grid(
+                centres, x, y, yerr, fit.break_number, self.chunk_size, nmodels
+            )
+            if not np.any(np.isfinite(log_like)):
+                raise ValueError('The likelihood is zero everywhere on the grid')
+            log_mass = log_like + log_cell_volume(edges)
+
+            new = refine_bounds(edges, log_mass, self.delta)
+            shrink = [
+                1 - width(b, log) / width(old, log)
+                for b, old, log in zip(new, bounds, log_spaced)
+            ]
+            if max(shrink) <= self.tol:
+                break
+            bounds = new
+
+        log_mass -= logsumexp(log_mass)
+        samples = self.draw(edges, log_mass)
+        return GridResult(
+            edges, log_like, log_mass, samples, fit.break_number, level, nmodels[0]
+        )
+
+    def draw(self, edges, log_mass):
+        """ nsamples draws of (Fvb, vb, p, log_f) from the grid posterior: a cell is picked by its probability and the draw placed uniformly within it (log-uniformly in Fvb and vb). """
+        rng = np.random.default_rng(self.seed)
+        cells = rng.choice(log_mass.size, self.nsamples, p=np.exp(log_mass.ravel()))
+        index = np.unravel_index(cells, log_mass.shape)
+        samples = np.empty((self.nsamples, 4))
+        for axis, (e, i, log) in enumerate(zip(edges, index, log_spaced)):
+            lo, hi = e[i], e[i + 1]
+            if log:
+                samples[:, axis] = np.exp(rng.uniform(np.log(lo), np.log(hi)))
+            else:
+                samples[:, axis] = rng.uniform(lo, hi)
+        return samples
@@ -1,4 +1,134 @@
 """ This module defines the likelihood and prior functions needed for the emcee fitting"""
-from tde_spectra_fit import init
 import numpy as np
 
+# break numbers for which p does not enter the spectral shape:
+p_free_breaks = (1, 8, 10, 11)
+
+
+def powerlaw(v, Fvb, vb, p, break_number):
+    """ Broken powerlaw from Granot & Sari 2002, ApJ, 568, 2, Figure 1 for the given break_number (1-11). """
+
+    if break_number == 1:
+        # if vsa < vm (slow cooling)
+        beta1 = 2
+        beta2 = 1 / 3
+        s = 1.64
+
+    if break_number == 2:
+        beta1 = 1 / 3
+        beta2 = (1 - p) / 2
+        s = 1.84 - (0.4 * p)
+
+    if break_number == 3:
+        beta1 = (1 - p) / 2
+        beta2 = -p / 2
+        s = 1.15 - (0.06 * p)
+
+    if break_number == 4:
+        beta1 = 2
+        beta2 = 5 / 2
+        s = 3.44 * p - 1.41
+
+    if break_number == 5:
+        # if vm < vsa < vs (slow cooling)
+        beta1 = 5 / 2
+        beta2 = (1 - p) / 2
+        s = 1.47 - (0.21 * p)
+
+    if break_number == 6:
+        # if vsa > vm (could be slow or fast cooling)
+        beta1 = 5 / 2
+        beta2 = -p / 2
+        s = 0.94 - 0.14 * p
+
+    if break_number == 7:
+        beta1 = 2
+        beta2 = 11 / 8
+        s = 1.99 - 0.04 * p
+
+    if break_number == 8:
+        # if vc < vsa < vm (fast cooling)
+        beta1 = 11 / 8
+        beta2 = -1 / 2
+        s = 0.907
+
+    if break_number == 9:
+        beta1 = -1 / 2
+        beta2 = -p / 2
+        s = 3.34 - 0.82 * p
+
+    if break_number == 10:
+        beta1 = 11 / 8
+        beta2 = 1 / 3
+        s = 1.213
+
+    if break_number == 11:
+        # if vsa < vc (fast cooling)
+        beta1 = 1 / 3
+        beta2 = -1 / 2
+        s = 0.597
+
+    Fv1 = Fvb * ((v / vb) ** (-beta1 * s) + (v / vb) ** (-beta2 * s)) ** (-1 / s)
+
+    return Fv1
+
+
+def log_likelihood(theta, x, y, yerr, break_number):
+    yerrup = yerr[1]
+    yerrlow = yerr[0]
+    Fvb, vb, p, log_f = theta
+    model = powerlaw(x, Fvb, vb, p, break_number)
+    sigma2 = (yerrup ** 2 + model ** 2 * np.exp(2 * log_f)) + (
+        yerrlow ** 2 + model ** 2 * np.exp(2 * log_f)
+    ) / 2
+    return -0.5 * np.sum((y - model) ** 2 / sigma2 + np.log(sigma2))
+
+
+# prior box on Fvb, vb, p and log_f, matching log_prior:
+prior_bounds = ((0.1, 1e4), (0.1, 5), (1, 3.5), (-10, 10))
+
+
+def log_prior(theta):
+    Fvb, vb, p, log_f = theta
+    if 0.1 < Fvb < 1e4 and 0.1 < vb < 5 and 1 < p < 3.5 and -10 < log_f < 10:
+        return 0.0
+    return -np.inf
+
+
+# combine prior and likelihood for log proability:
+def log_probability(theta, x, y, yerr, break_number):
+
+    lp = log_prior(theta)
+    if not np.isfinite(lp):
+        return -np.inf
+    return lp + log_likelihood(theta, x, y, yerr, break_number)
+
+
+# batched versions of the above, evaluating theta of shape (nwalkers, 4) in one call
+# (used with emcee's vectorize=True and by the benchmarks):
+def log_likelihood_vectorized(theta, x, y, yerr, break_number):
+    yerrup = yerr[1]
+    yerrlow = yerr[0]
+    Fvb, vb, p, log_f = (theta[:, i, None] for i in range(4))
+    model = powerlaw(x, Fvb, vb, p, break_number)
+    sigma2 = (yerrup ** 2 + model ** 2 * np.exp(2 * log_f)) + (
+        yerrlow ** 2 + model ** 2 * np.exp(2 * log_f)
+    ) / 2
+    return -0.5 * np.sum((y - model) ** 2 / sigma2 + np.log(sigma2), axis=-1)
+
+
+def log_prior_vectorized(theta):
+    inside = np.ones(len(theta), dtype=bool)
+    for i, (lo, hi) in enumerate(prior_bounds):
+        inside &= (lo < theta[:, i]) & (theta[:, i] < hi)
+    return np.where(inside, 0.0, -np.inf)
+
+
+def log_probability_vectorized(theta, x, y, yerr, break_number):
+    theta = np.asarray(theta)
+    lp = log_prior_vectorized(theta)
+    inside = np.isfinite(lp)
+    lp[inside] += log_likelihood_vectorized(
+        theta[inside], x, y, yerr, break_number
+    )
+    return lp
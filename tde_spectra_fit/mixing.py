@@ -0,0 +1,101 @@
+""" Harness to compare the mixing efficiency of emcee move mixes on the reference spectra """
+import time
+
+import numpy as np
+
+from tde_spectra_fit.examples import reference_spectra
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+default_move_mixes = (
+    'stretch',
+    'de',
+    'de:0.8,desnooker:0.2',
+    'stretch:0.5,de:0.5',
+    'kde',
+)
+
+
+def benchmark_moves(
+    move_mixes=default_move_mixes,
+    spectra=('Alexander_2016',),
+    nwalkers=64,
+    nsteps=3000,
+    burnin=150,
+    target_ess=10000,
+    seed=42,
+):
+    """ Run emcee with each move mix on each reference spectrum and report how efficiently it mixes.
+
+    Parameters:
+    move_mixes: list of move mixes in any form accepted by TDE_fit's moves argument
+    spectra: list of names from examples.reference_spectra, or dictionaries of TDE_fit keyword arguments
+    nwalkers: integer, number of walkers
+    nsteps: integer, number of steps per run
+    burnin: integer, number of steps discarded before estimating the autocorrelation time
+    target_ess: integer, effective sample size used to quote the cost of each mix
+    seed: integer, numpy random seed set before every run so mixes see the same starting walkers
+
+    Returns a list of dictionaries, one per (spectrum, mix), with:
+    tau: integrated autocorrelation time of each parameter, in steps
+    ess: effective number of samples after burn-in, for the worst mixing parameter (0 if a walker got stuck)
+    n_eval: number of likelihood evaluations
+    ess_per_eval: ess / n_eval
+    evals_to_target: likelihood evaluations needed to reach target_ess
+    acceptance: mean acceptance fraction
+    wall_time: seconds taken by the run
+
+    """
+    rows = []
+    for spectrum in spectra:
+        if isinstance(spectrum, str):
+            spectrum = reference_spectra[spectrum]
+        for mix in move_mixes:
+            fit = TDE_fit(**spectrum, nwalkers=nwalkers, nsteps=nsteps, moves=mix)
+
+            np.random.seed(seed)
+            start = time.perf_counter()
+            sampler = fit.run_emcee()
+            wall_time = time.perf_counter() - start
+
+            # quiet=True still returns an estimate for chains shorter than 50 tau, and a
+            # walker that never moves after burn-in gives nan, i.e. the mix does not mix:
+            with np.errstate(invalid='ignore'):
+                tau = sampler.get_autocorr_time(discard=burnin, quiet=True)
+            tau = np.where(np.isfinite(tau), tau, np.inf)
+            n_eval = nwalkers * (nsteps + 1)
+            ess = nwalkers * (nsteps - burnin) / np.max(tau)
+            rows.append(
+                dict(
+                    spectrum=fit.name,
+                    moves=mix if isinstance(mix, str) else repr(mix),
+                    tau=tau.tolist(),
+                    ess=ess,
+                    n_eval=n_eval,
+                    ess_per_eval=ess / n_eval,
+                    evals_to_target=target_ess * n_eval / ess,
+                    acceptance=float(np.mean(sampler.acceptance_fraction)),
+                    wall_time=wall_time,
+                )
+            )
+
+    print_benchmark(rows)
+    return rows
+
+
+def print_benchmark(rows):
+    print('----------------------------------------------------------')
+    print(
+        f'{"spectrum":<22} {"moves":<24} {"max tau":>8} {"ESS":>8} '
+        f'{"ESS/eval":>9} {"evals to target":>16} {"acc":>5}'
+    )
+    for row in rows:
+        print(
+            f'{row["spectrum"]:<22} {row["moves"]:<24} {max(row["tau"]):8.1f} '
+            f'{row["ess"]:8.0f} {row["ess_per_eval"]:9.2e} '
+            f'{row["evals_to_target"]:16.3g} {row["acceptance"]:5.2f}'
+        )
+    print('----------------------------------------------------------')
+
+
+if __name__ == '__main__':
+    benchmark_moves()
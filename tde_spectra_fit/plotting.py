@@ -0,0 +1,178 @@
+""" Out-of-core trace and corner plots. The chain is read in chunks of steps and reduced to histograms and per-step walker quantiles, so plotting memory and cost do not grow with the number of samples """
+import matplotlib.pyplot as plt
+import numpy as np
+
+from tde_spectra_fit.chains import load_chain
+
+
+def iter_chunks(chains, chunk_steps, start=0, thin=1):
+    """ Yield (first step, chunk) of the chains, a list of arrays of shape (nsteps, nwalkers, ndim) with their walkers joined side by side, chunk_steps steps at a time from step start, keeping every thin-th step. """
+    chunk_steps = max(thin, chunk_steps - chunk_steps % thin)
+    for first in range(start, len(chains[0]), chunk_steps):
+        steps = slice(first, first + chunk_steps, thin)
+        yield first, np.concatenate([np.asarray(c[steps]) for c in chains], axis=1)
+
+
+class ChainSummary:
+    def __init__(
+        self,
+        chain,
+        burnin=0,
+        thin=1,
+        bins=40,
+        quantiles=(2.5, 16, 50, 84, 97.5),
+        range_quantiles=(0.5, 99.5),
+        chunk_steps=500,
+        max_trace_points=2000,
+    ):
+        """ Histogram and quantile summaries of an MCMC chain, accumulated one chunk of steps at a time.
+
+        Parameters:
+        chain: array-like of shape (nsteps, nwalkers, ndim), e.g. a memory mapped chain from chains.load_chain, or a list of such chains of the same length (e.g. the replicas' chains, from replicas.ReplicaResult.get_chains), whose walkers are put side by side
+        burnin: integer, number of steps left out of the histograms (but kept in the trace envelopes)
+        thin: integer, only every thin-th step after burnin goes into the histograms, the same steps as emcee's get_chain(discard=burnin, thin=thin)
+        bins: integer, number of histogram bins per parameter
+        quantiles: percentiles of the walkers drawn as envelopes in the trace plot
+        range_quantiles: percentiles of the samples that set the histogram range, to keep stray walkers from squashing the plots
+        chunk_steps: integer, number of steps read at a time
+        max_trace_points: integer, longer chains are binned in steps for the trace envelopes, pooling the walkers of all steps in a bin
+
+        """
+        chains = list(chain) if isinstance(chain, (list, tuple)) else [chain]
+        self.nsteps, _, self.ndim = chains[0].shape
+        self.nwalkers = sum(c.shape[1] for c in chains)
+        self.quantiles = quantiles
+        if burnin + thin - 1 >= self.nsteps:
+            raise ValueError(
+                f'burnin ({burnin}) and thin ({thin}) leave no steps of the chain'
+            )
+
+        # pass 1: walker quantiles per bin of steps, and the range of the post burn-in samples
+        self.bin_steps = -(-self.nsteps // max_trace_points)
+        chunk_steps = max(1, chunk_steps // self.bin_steps) * self.bin_steps
+        self.steps = np.arange(0, self.nsteps, self.bin_steps)
+        self.envelopes = np.empty((len(self.steps), len(quantiles), self.ndim))
+        lo = np.full(self.ndim, np.inf)
+        hi = np.full(self.ndim, -np.inf)
+        for first, chunk in iter_chunks(chains, chunk_steps):
+            for k in range(0, len(chunk), self.bin_steps):
+                pooled = chunk[k : k + self.bin_steps].reshape(-1, self.ndim)
+                b = (first + k) // self.bin_steps
+                self.envelopes[b] = np.percentile(pooled, quantiles, axis=0)
+            post = chunk[max(0, burnin - first) :]
+            if len(post):
+                lo = np.minimum(lo, post.min(axis=(0, 1)))
+                hi = np.maximum(hi, post.max(axis=(0, 1)))
+
+        # pass 2: fine histograms to find the central range_quantiles of each parameter
+        first_kept = burnin + thin - 1
+        fine = [np.zeros(1000) for _ in range(self.ndim)]
+        for _, chunk in iter_chunks(chains, chunk_steps, first_kept, thin):
+            flat = chunk.reshape(-1, self.ndim)
+            for i in range(self.ndim):
+                fine[i] += np.histogram(flat[:, i], bins=1000, range=(lo[i], hi[i]))[0]
+        self.ranges = []
+        for i in range(self.ndim):
+            edges = np.linspace(lo[i], hi[i], 1001)
+            cdf = np.cumsum(fine[i]) / np.sum(fine[i])
+            a, b = np.interp(np.array(range_quantiles) / 100, cdf, edges[1:])
+            self.ranges.append((a, b) if b > a else (lo[i], hi[i] + 1e-12))
+
+        # pass 3: 1D and 2D histograms within those ranges
+        self.edges = [np.linspace(a, b, bins + 1) for a, b in self.ranges]
+        self.hist1d = [np.zeros(bins) for _ in range(self.ndim)]
+        self.hist2d = {}
+        self.nsamples = 0
+        for _, chunk in iter_chunks(chains, chunk_steps, first_kept, thin):
+            flat = chunk.reshape(-1, self.ndim)
+            self.nsamples += len(flat)
+            for i in range(self.ndim):
+                self.hist1d[i] += np.histogram(flat[:, i], bins=self.edges[i])[0]
+                for j in range(i):
+                    h = np.histogram2d(
+                        flat[:, j], flat[:, i], bins=(self.edges[j], self.edges[i])
+                    )[0]
+                    self.hist2d[i, j] = self.hist2d.get((i, j), 0) + h
+
+
+def sigma_levels(h, sigmas=(1, 2)):
+    """ Density levels of a 2D histogram enclosing the probability mass within the given number of sigma of a 2D Gaussian, as used by corner. """
+    flat = np.sort(h.ravel())[::-1]
+    cdf = np.cumsum(flat) / np.sum(flat)
+    levels = []
+    for s in sigmas:
+        k = np.searchsorted(cdf, 1 - np.exp(-0.5 * s ** 2))
+        levels.append(flat[min(k, len(flat) - 1)])
+    return sorted(set(levels))
+
+
+def plot_traces(summary, labels):
+    """ Trace plot of the per-step walker quantile envelopes, in place of one line per walker. """
+    fig, axes = plt.subplots(summary.ndim, figsize=(10, 7), sharex=True)
+    steps = summary.steps
+    nq = len(summary.quantiles)
+    for i in range(summary.ndim):
+        ax = axes[i]
+        for k in range(nq // 2):
+            ax.fill_between(
+                steps,
+                summary.envelopes[:, k, i],
+                summary.envelopes[:, nq - 1 - k, i],
+                color='k',
+                alpha=0.2,
+                lw=0,
+            )
+        if nq % 2:
+            ax.plot(steps, summary.envelopes[:, nq // 2, i], 'k', lw=0.8)
+        ax.set_xlim(0, summary.nsteps)
+        ax.set_ylabel(labels[i])
+        ax.yaxis.set_label_coords(-0.1, 0.5)
+
+    axes[-1].set_xlabel("step number")
+    return fig
+
+
+def plot_corner(summary, labels):
+    """ Corner plot drawn from the accumulated 1D and 2D histograms. """
+    ndim = summary.ndim
+    fig, axes = plt.subplots(ndim, ndim, figsize=(2.5 * ndim, 2.5 * ndim))
+    for i in range(ndim):
+        for j in range(ndim):
+            ax = axes[i, j]
+            if j > i:
+                ax.set_axis_off()
+                continue
+            if i == j:
+                ax.stairs(summary.hist1d[i], summary.edges[i], color='k')
+                ax.set_yticks([])
+            else:
+                h = summary.hist2d[i, j].T
+                centres_x = 0.5 * (summary.edges[j][1:] + summary.edges[j][:-1])
+                centres_y = 0.5 * (summary.edges[i][1:] + summary.edges[i][:-1])
+                ax.pcolormesh(summary.edges[j], summary.edges[i], h, cmap='Greys')
+                if h.sum() > 0:
+                    levels = sigma_levels(h)
+                    ax.contour(centres_x, centres_y, h, levels=levels, colors='k')
+                ax.set_ylim(summary.ranges[i])
+            ax.set_xlim(summary.ranges[j])
+            if i < ndim - 1:
+                ax.set_xticklabels([])
+            else:
+                ax.set_xlabel(labels[j])
+            if j > 0:
+                ax.set_yticklabels([])
+            elif i > 0:
+                ax.set_ylabel(labels[i])
+    fig.subplots_adjust(wspace=0.05, hspace=0.05)
+    return fig
+
+
+def plot_chain_file(
+    chain_file, name, labels=("Fvb", "vb", "p", "log(f)"), burnin=150, thin=15
+):
+    """ Write {name}_chains.pdf and {name}_2dposteriors.pdf for a chain saved by chains.MemmapBackend, reading it in chunks. """
+    chain, _ = load_chain(chain_file)
+    summary = ChainSummary(chain, burnin=burnin, thin=thin)
+    plot_traces(summary, labels).savefig(f'{name}_chains.pdf')
+    plot_corner(summary, labels).savefig(f'{name}_2dposteriors.pdf')
+    return summary
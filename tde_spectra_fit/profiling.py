@@ -0,0 +1,131 @@
+""" Opt-in instrumentation of a fit: stage timers, likelihood counters, acceptance fractions and peak memory, written to a JSON report """
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from tde_spectra_fit.likelihood import (
+    log_prior,
+    log_prior_vectorized,
+    log_probability,
+    log_probability_vectorized,
+)
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """ Peak resident memory of this process in MB, or None where the resource module is unavailable. """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux:
+    if sys.platform == 'darwin':
+        return maxrss / 1024 ** 2
+    return maxrss / 1024
+
+
+class CountingLogProbability:
+    def __init__(self, vectorize=False):
+        """ Drop-in replacement for likelihood.log_probability (or log_probability_vectorized if vectorize=True) that counts likelihood evaluations and proposals rejected by log_prior. Counts made in worker processes (e.g. with a multiprocessing pool) are not sent back. """
+        self.vectorize = vectorize
+        self.ncalls = 0
+        self.nprior_rejected = 0
+
+    def __call__(self, theta, x, y, yerr, break_number):
+        if self.vectorize:
+            self.ncalls += len(theta)
+            lp = log_prior_vectorized(theta)
+            self.nprior_rejected += int(np.sum(~np.isfinite(lp)))
+            return log_probability_vectorized(theta, x, y, yerr, break_number)
+
+        self.ncalls += 1
+        if not np.isfinite(log_prior(theta)):
+            self.nprior_rejected += 1
+            return -np.inf
+        return log_probability(theta, x, y, yerr, break_number)
+
+
+class FitProfile:
+    def __init__(self, name, vectorize=False):
+        """ Collects timings and counters for one TDE_fit run (and optionally the SEM analysis that follows it).
+
+        Parameters:
+        name: string, name of the fit, the report is written to {name}_profile.json
+        vectorize: True or False, whether the fit evaluates the log-probability in batches
+
+        """
+        self.name = name
+        self.path = None
+        self.stages = {}
+        self.info = {}
+        self.log_probability = CountingLogProbability(vectorize)
+        self.acceptance_fraction = None
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """ Time a block under the given stage name. Time spent in a nested stage is only counted towards the inner stage. """
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def record_sampler(self, sampler):
+        self.acceptance_fraction = np.asarray(sampler.acceptance_fraction)
+
+    def report(self):
+        ncalls = self.log_probability.ncalls
+        nrejected = self.log_probability.nprior_rejected
+        sampling_time = self.stages.get('sampling', 0.0)
+        if ncalls == 0:
+            # backends such as 'laplace' and 'grid' do not go through the counter:
+            likelihood = dict(
+                calls=None,
+                calls_per_second=None,
+                prior_rejected=None,
+                prior_rejected_fraction=None,
+            )
+        else:
+            likelihood = dict(
+                calls=ncalls,
+                calls_per_second=ncalls / sampling_time if sampling_time > 0 else None,
+                prior_rejected=nrejected,
+                prior_rejected_fraction=nrejected / ncalls,
+            )
+        report = dict(
+            name=self.name,
+            **self.info,
+            stages=self.stages,
+            total_time=sum(self.stages.values()),
+            likelihood=likelihood,
+            peak_memory_mb=peak_memory_mb(),
+        )
+        if self.acceptance_fraction is not None:
+            report['acceptance_fraction'] = dict(
+                mean=float(np.mean(self.acceptance_fraction)),
+                min=float(np.min(self.acceptance_fraction)),
+                max=float(np.max(self.acceptance_fraction)),
+                per_walker=self.acceptance_fraction.tolist(),
+            )
+        return report
+
+    def write(self, path=None):
+        """ Write the report to path, by default {name}_profile.json next to the fit's PDFs, and return the path. """
+        if path is None:
+            path = f'{self.name}_profile.json'
+        self.path = path
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
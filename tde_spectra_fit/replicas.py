@@ -0,0 +1,305 @@
+""" Independent replica ensembles run in separate processes from dispersed starting points, with split R-hat and bulk/tail effective sample sizes (Vehtari et al 2021, Bayesian Analysis, 16, 667) to check that the replicas found the same posterior before they are merged """
+import copy
+import multiprocessing
+import os
+import time
+
+import emcee
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import rankdata
+
+from tde_spectra_fit.chains import load_chain
+from tde_spectra_fit.likelihood import prior_bounds
+
+
+def rank_normalize(x):
+    """ Normal scores of the ranks of x, shape (nchains, ndraws), pooled over all chains. """
+    r = rankdata(x, axis=None).reshape(x.shape)
+    return ndtri((r - 3 / 8) / (x.size + 1 / 4))
+
+
+def split_chains(x):
+    """ Split each chain of x, shape (nchains, ndraws), into its first and second half, giving 2 * nchains chains. """
+    n = x.shape[1] // 2
+    return np.concatenate([x[:, :n], x[:, x.shape[1] - n :]])
+
+
+def _rhat(x):
+    n = x.shape[1]
+    W = np.mean(np.var(x, axis=1, ddof=1))
+    var_hat = (n - 1) / n * W + np.var(np.mean(x, axis=1), ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(var_hat / W)
+
+
+def split_rhat(x):
+    """ Rank normalised split R-hat of x, shape (nchains, ndraws): the larger of the bulk and the folded (tail) value. Values above 1.01 mean the chains do not agree. """
+    x = split_chains(x)
+    bulk = _rhat(rank_normalize(x))
+    tail = _rhat(rank_normalize(np.abs(x - np.median(x))))
+    return max(bulk, tail)
+
+
+def _ess(x):
+    m, n = x.shape
+    # autocovariance of each chain, by FFT:
+    centred = x - x.mean(axis=1, keepdims=True)
+    f = np.fft.rfft(centred, n=2 * n, axis=1)
+    acov = np.fft.irfft(f * np.conj(f), axis=1)[:, :n] / n
+    W = np.mean(acov[:, 0]) * n / (n - 1)
+    var_hat = (n - 1) / n * W + np.var(np.mean(x, axis=1), ddof=1)
+    if not var_hat > 0:
+        return np.nan
+    rho = 1 - (W - acov.mean(axis=0)) / var_hat
+    rho[0] = 1
+
+    # Geyer's initial monotone sequence of autocorrelation pair sums:
+    pairs = rho[: n - n % 2].reshape(-1, 2).sum(axis=1)
+    negative = np.flatnonzero(pairs < 0)
+    if len(negative):
+        pairs = pairs[: negative[0]]
+    pairs = np.minimum.accumulate(pairs)
+    tau = max(-1 + 2 * pairs.sum(), 1 / np.log10(m * n))
+    return m * n / tau
+
+
+def bulk_ess(x):
+    """ Bulk effective sample size of x, shape (nchains, ndraws), from the rank normalised split chains. """
+    return _ess(rank_normalize(split_chains(x)))
+
+
+def tail_ess(x, quantiles=(0.05, 0.95)):
+    """ Tail effective sample size of x, shape (nchains, ndraws): the smaller effective sample size of the indicators of x being below its 5% and 95% quantiles. """
+    x = split_chains(x)
+    return min(_ess((x <= np.quantile(x, q)).astype(float)) for q in quantiles)
+
+
+def walker_draws(chains, i):
+    """ Draws of parameter i with each walker of each replica as a chain, shape (nreplicas * nwalkers, ndraws). """
+    return np.concatenate([chain[:, :, i].T for chain in chains])
+
+
+def replica_draws(chains, i):
+    """ Draws of parameter i with each replica as one chain of all its walkers in step order, shape (nreplicas, ndraws * nwalkers). """
+    return np.array([chain[:, :, i].ravel() for chain in chains])
+
+
+def disperse(initial, nreplicas, dispersion, rng):
+    """ Starting Fvb, vb, p of each replica, scattered about initial by factors exp(dispersion * N(0, 1)) and kept inside the prior box. """
+    lo = np.array([b[0] for b in prior_bounds[:3]]) * 1.05
+    hi = np.array([b[1] for b in prior_bounds[:3]]) / 1.05
+    scatter = np.exp(dispersion * rng.standard_normal((nreplicas, 3)))
+    return np.clip(np.array(initial) * scatter, lo, hi)
+
+
+def replica_path(chain_file, r):
+    root, ext = os.path.splitext(chain_file)
+    return f'{root}_replica{r}{ext or ".npy"}'
+
+
+def run_replica(job):
+    """ Run the emcee ensemble of one replica; job is (fit, seed). Runs in a worker process and returns the chain, log-probabilities and acceptance fractions. With a chain_file the chain and log-probabilities are left in the file, for the parent to memory map. """
+    fit, seed = job
+    start = time.perf_counter()
+    np.random.seed(seed)
+    sampler = fit.run_emcee()
+    result = dict(
+        seed=seed,
+        initial=list(fit.initial),
+        acceptance_fraction=sampler.acceptance_fraction,
+        summary=fit.streaming_summary,
+    )
+    if fit.chain_file is None:
+        result['chain'] = sampler.get_chain()
+        result['log_prob'] = sampler.get_log_prob()
+    result['wall_time'] = time.perf_counter() - start
+    return result
+
+
+class ReplicaResult:
+    def __init__(self, replicas, accepted, diagnostics):
+        """ Merged posterior of the accepted replicas, read by do_fit as it reads an emcee.EnsembleSampler. The walkers of the accepted replicas are put side by side, as one ensemble.
+
+        Parameters:
+        replicas: list of dictionaries returned by run_replica, with the chain and log_prob of each replica
+        accepted: list of indices of the replicas that agree with the best one and are merged
+        diagnostics: dictionary of split R-hat, bulk and tail ESS, see ReplicaBackend.run
+
+        """
+        self.replicas = replicas
+        self.accepted = accepted
+        self.diagnostics = diagnostics
+        self.acceptance_fraction = np.concatenate(
+            [replicas[r]['acceptance_fraction'] for r in accepted]
+        )
+
+    def get_chains(self, discard=0, thin=1):
+        """ Chains of the accepted replicas, each of shape (nsteps, nwalkers, ndim), without joining them: with a chain_file they stay memory mapped, for plotting.ChainSummary. """
+        # the same steps as emcee's get_chain:
+        return [
+            self.replicas[r]['chain'][discard + thin - 1 :: thin] for r in self.accepted
+        ]
+
+    def get_chain(self, discard=0, thin=1, flat=False):
+        chain = np.concatenate(self.get_chains(discard, thin), axis=1)
+        if flat:
+            return chain.reshape(-1, chain.shape[-1])
+        return chain
+
+    def get_log_prob(self, discard=0, thin=1, flat=False):
+        log_prob = np.concatenate(
+            [
+                self.replicas[r]['log_prob'][discard + thin - 1 :: thin]
+                for r in self.accepted
+            ],
+            axis=1,
+        )
+        if flat:
+            return log_prob.ravel()
+        return log_prob
+
+    def get_autocorr_time(self, discard=0, thin=1, **kwargs):
+        # averaged over the replicas, weighted by their walkers, one replica at a time:
+        chains = self.get_chains(discard, thin)
+        tau = [emcee.autocorr.integrated_time(c, **kwargs) for c in chains]
+        return thin * np.average(tau, axis=0, weights=[c.shape[1] for c in chains])
+
+
+class ReplicaBackend:
+    name = 'replicas'
+
+    def __init__(
+        self,
+        nreplicas=4,
+        workers=None,
+        dispersion=0.3,
+        rhat_threshold=1.01,
+        thin=15,
+        seed=None,
+    ):
+        """ Convergence checking backend: runs nreplicas independent emcee ensembles (each of the fit's nwalkers and nsteps) with different seeds and dispersed starting points, in separate processes. Replicas are merged, best mean log-probability first, while the split R-hat between them stays below rhat_threshold, so that a replica stuck in another mode, or at the edge of the prior box, is left out of the posterior.
+
+        Parameters:
+        nreplicas: integer, number of independent ensembles
+        workers: integer or None, number of worker processes, default one per replica up to the number of CPUs. Replicas run one after another when workers is 1 or when already inside a worker process (e.g. the command line tool with -j).
+        dispersion: float, log-normal scatter of the replica starting Fvb, vb and p about the fit's initial guess
+        rhat_threshold: float, largest split R-hat between merged replicas
+        thin: integer, thinning of the post burn-in chains for the diagnostics
+        seed: integer or None, seed for the replica seeds and starting points
+
+        The fit needs store_chain=True and store_log_prob=True. With streaming=True each replica streams its own summary, and the summaries of the merged replicas are merged. With a chain_file, replica r is kept in {chain_file root}_replica{r}.npy, and do_fit summarises the merged replicas' chains side by side, a chunk of steps at a time, without loading them.
+        """
+        self.nreplicas = nreplicas
+        self.workers = workers
+        self.dispersion = dispersion
+        self.rhat_threshold = rhat_threshold
+        self.thin = thin
+        self.seed_sequence = np.random.SeedSequence(seed)
+
+    def run(self, fit):
+        if not fit.store_chain or not fit.store_log_prob:
+            raise ValueError(
+                'the replicas backend needs the chains and log-probabilities, '
+                'set store_chain=True and store_log_prob=True'
+            )
+        seed_sequence, start_sequence = self.seed_sequence.spawn(2)
+        seeds = [
+            int(s.generate_state(1)[0]) for s in seed_sequence.spawn(self.nreplicas)
+        ]
+        starts = disperse(
+            fit.initial,
+            self.nreplicas,
+            self.dispersion,
+            np.random.default_rng(start_sequence),
+        )
+
+        jobs = []
+        for r in range(self.nreplicas):
+            replica = copy.copy(fit)
+            replica.initial = tuple(starts[r])
+            replica.profile = None
+            if fit.chain_file is not None:
+                replica.chain_file = replica_path(fit.chain_file, r)
+            jobs.append((replica, seeds[r]))
+
+        workers = self.workers or min(self.nreplicas, os.cpu_count())
+        if workers == 1 or multiprocessing.current_process().daemon:
+            replicas = list(map(run_replica, jobs))
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                replicas = pool.map(run_replica, jobs)
+        for r, (replica, _) in enumerate(jobs):
+            if replica.chain_file is not None:
+                replicas[r]['chain'], replicas[r]['log_prob'] = load_chain(
+                    replica.chain_file
+                )
+
+        result = self.merge(replicas, fit.stored_burnin)
+        if fit.streaming:
+            fit.streaming_summary = replicas[result.accepted[0]]['summary']
+            for r in result.accepted[1:]:
+                fit.streaming_summary.merge(replicas[r]['summary'])
+        self.print_diagnostics(result)
+        return result
+
+    def merge(self, replicas, burnin):
+        """ Diagnose the replicas and merge the ones that agree, returns a ReplicaResult. """
+        first = burnin + self.thin - 1
+        draws = [np.asarray(r['chain'][first :: self.thin]) for r in replicas]
+        ndim = draws[0].shape[-1]
+        for r, replica in enumerate(replicas):
+            replica['mean_log_prob'] = np.mean(replica['log_prob'][first :: self.thin])
+
+        def replica_rhat(members):
+            chains = [draws[r] for r in members]
+            return np.array([split_rhat(replica_draws(chains, i)) for i in range(ndim)])
+
+        # best replica first, then each replica that agrees with the merged ones:
+        order = np.argsort([-r['mean_log_prob'] for r in replicas])
+        accepted = [int(order[0])]
+        for r in order[1:]:
+            if np.max(replica_rhat(accepted + [r])) < self.rhat_threshold:
+                accepted.append(int(r))
+        accepted.sort()
+
+        merged = [draws[r] for r in accepted]
+        all_rhat = replica_rhat(range(len(replicas)))
+        diagnostics = dict(
+            nreplicas=len(replicas),
+            accepted=accepted,
+            converged=bool(np.max(all_rhat) < self.rhat_threshold),
+            replica_rhat=all_rhat.tolist(),
+            rhat=[split_rhat(walker_draws(merged, i)) for i in range(ndim)],
+            ess_bulk=[bulk_ess(walker_draws(merged, i)) for i in range(ndim)],
+            ess_tail=[tail_ess(walker_draws(merged, i)) for i in range(ndim)],
+        )
+        return ReplicaResult(replicas, accepted, diagnostics)
+
+    def print_diagnostics(self, result):
+        labels = ["Fvb", "vb", "p", "log(f)"]
+        print('----------------------------------------------------------')
+        print('Replica ensembles:')
+        print('replica  start (Fvb, vb, p)         mean log-prob  acceptance  merged')
+        for r, replica in enumerate(result.replicas):
+            start = ', '.join(f'{v:.3g}' for v in replica['initial'][:3])
+            merged = 'yes' if r in result.accepted else 'no'
+            print(
+                f'{r:<8} {start:<26} {replica["mean_log_prob"]:>13.2f}'
+                f'  {np.mean(replica["acceptance_fraction"]):>10.3f}  {merged}'
+            )
+        diagnostics = result.diagnostics
+        print('parameter  R-hat (replicas)  R-hat (merged)  bulk ESS  tail ESS')
+        for i, label in enumerate(labels):
+            print(
+                f'{label:<10} {diagnostics["replica_rhat"][i]:>16.3f}'
+                f'  {diagnostics["rhat"][i]:>14.3f}'
+                f'  {diagnostics["ess_bulk"][i]:>8.0f}'
+                f'  {diagnostics["ess_tail"][i]:>8.0f}'
+            )
+        if not diagnostics['converged']:
+            print(
+                f'**warning** the replicas disagree (R-hat > {self.rhat_threshold}), '
+                f'only replicas {diagnostics["accepted"]} were merged'
+            )
+        print('----------------------------------------------------------')
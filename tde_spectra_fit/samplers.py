@@ -0,0 +1,241 @@
+""" Sampler backends used by TDE_fit.do_fit to draw posterior samples of Fvb, vb, p and log_f """
+import emcee
+import numpy as np
+from scipy.optimize import minimize
+
+from tde_spectra_fit.chains import IndependentDraws
+from tde_spectra_fit.grid import GridBackend
+from tde_spectra_fit.likelihood import log_likelihood, prior_bounds
+from tde_spectra_fit.replicas import ReplicaBackend
+
+
+class EmceeBackend:
+    """ Full MCMC backend: runs TDE_fit.run_emcee and returns the emcee.EnsembleSampler. """
+
+    name = 'emcee'
+
+    def run(self, fit):
+        return fit.run_emcee()
+
+
+class LaplaceResult(IndependentDraws):
+    def __init__(
+        self, samples, theta_map, cov, log_prob_map, nfev, success, at_bound
+    ):
+        """ Independent draws from the Laplace approximation, see chains.IndependentDraws. The fit details are also kept in diagnostics, which do_fit adds to its summary, so that triage runs can flag the spectra needing a full MCMC run.
+
+        Parameters:
+        samples: array of shape (nsamples, 4), posterior draws of Fvb, vb, p, log_f
+        theta_map: array, maximum a posteriori Fvb, vb, p, log_f
+        cov: array of shape (4, 4), covariance of the Gaussian in (log Fvb, log vb, log p, log_f) space
+        log_prob_map: float, log-probability at theta_map
+        nfev: integer, number of log-probability evaluations used
+        success: bool, whether the MAP optimiser converged
+        at_bound: array of 4 bools, whether theta_map sits on the prior bound of Fvb, vb, p, log_f
+
+        """
+        super().__init__(samples)
+        self.theta_map = theta_map
+        self.cov = cov
+        self.log_prob_map = log_prob_map
+        self.nfev = nfev
+        self.success = success
+        self.at_bound = at_bound
+        # log_f on its lower bound only means that no extra scatter is needed:
+        self.at_prior_bound = bool(np.any(at_bound[:3]))
+        self.diagnostics = dict(
+            theta_map=theta_map.tolist(),
+            log_prob_map=log_prob_map,
+            nfev=nfev,
+            success=success,
+            at_prior_bound=self.at_prior_bound,
+        )
+
+
+class LaplaceBackend:
+    name = 'laplace'
+
+    def __init__(
+        self, nsamples=10000, step=1e-4, maxiter=1000, log_f_starts=(1, -3, -7), seed=None
+    ):
+        """ Fast triage backend: finds the maximum a posteriori (MAP) parameters within the prior box and approximates the posterior as a Gaussian in (log Fvb, log vb, log p, log_f) space, with covariance from the numerical Hessian of the log-likelihood at the MAP. Draws falling outside the prior box are rejected. A MAP on the prior bound of Fvb, vb or p is warned about and flagged in the summary (at_prior_bound): the posterior is then cut by the prior, which the Gaussian only roughly follows, so such spectra need the full MCMC.
+
+        Parameters:
+        nsamples: integer, number of posterior draws to return
+        step: float, finite difference step size (in log-parameter space) for the Hessian
+        maxiter: integer, maximum number of optimiser iterations
+        log_f_starts: starting values of log_f to choose from, the optimiser starts from the most probable one
+        seed: integer or None, seed for the posterior draws
+
+        """
+        self.nsamples = nsamples
+        self.step = step
+        self.maxiter = maxiter
+        self.log_f_starts = log_f_starts
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, fit):
+        x = fit.frequency
+        y = fit.flux_emission
+        yerr = [fit.fd_err_low, fit.fd_err_up]
+        break_number = fit.break_number
+        nfev = [0]
+
+        # log-likelihood in u = (log Fvb, log vb, log p, log_f), including the Jacobian.
+        # The prior is flat, so within the box this is the log-probability, and it stays
+        # finite past the box for the Hessian at a bound:
+        def log_like_u(u):
+            nfev[0] += 1
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                ll = log_likelihood(to_theta(u), x, y, yerr, break_number)
+            if not np.isfinite(ll):
+                return -np.inf
+            return ll + np.sum(u[:3])
+
+        # start from the initial guess at the most probable level of extra scatter, f:
+        lo = to_u(np.array([b[0] for b in prior_bounds], dtype=float))
+        hi = to_u(np.array([b[1] for b in prior_bounds], dtype=float))
+        starts = [
+            np.clip(to_u(np.array([*fit.initial[:3], log_f], dtype=float)), lo, hi)
+            for log_f in self.log_f_starts
+        ]
+        opt = minimize(
+            lambda u: -log_like_u(u),
+            max(starts, key=log_like_u),
+            method='L-BFGS-B',
+            bounds=list(zip(lo, hi)),
+            options={'maxiter': self.maxiter},
+        )
+        u_map = opt.x
+        at_bound = (u_map - lo < 10 * self.step) | (hi - u_map < 10 * self.step)
+        theta_map = to_theta(u_map)
+        if np.any(at_bound[:3]):
+            names = [n for n, b in zip(('Fvb', 'vb', 'p'), at_bound) if b]
+            print(
+                f'**warning** the MAP {", ".join(names)} sits on the prior bound, '
+                'the Laplace approximation is unreliable there: run emcee on this spectrum'
+            )
+
+        cov = laplace_covariance(log_like_u, u_map, self.step, at_bound)
+        samples = draw_truncated(u_map, cov, self.nsamples, self.rng)
+
+        return LaplaceResult(
+            samples,
+            theta_map,
+            cov,
+            float(log_likelihood(theta_map, x, y, yerr, break_number)),
+            nfev[0],
+            bool(opt.success),
+            at_bound,
+        )
+
+
+def to_u(theta):
+    return np.concatenate([np.log(theta[..., :3]), theta[..., 3:]], axis=-1)
+
+
+def to_theta(u):
+    return np.concatenate([np.exp(u[..., :3]), u[..., 3:]], axis=-1)
+
+
+def hessian(f, x, h):
+    """ Central finite difference Hessian of the scalar function f at x. """
+    n = len(x)
+    H = np.empty((n, n))
+    f0 = f(x)
+    for i in range(n):
+        ei = np.zeros(n)
+        ei[i] = h
+        H[i, i] = (f(x + ei) - 2 * f0 + f(x - ei)) / h ** 2
+        for j in range(i + 1, n):
+            ej = np.zeros(n)
+            ej[j] = h
+            H[i, j] = (
+                f(x + ei + ej) - f(x + ei - ej) - f(x - ei + ej) + f(x - ei - ej)
+            ) / (4 * h ** 2)
+            H[j, i] = H[i, j]
+    return H
+
+
+def laplace_covariance(log_prob, x, h, at_bound=None, min_curvature=1e-2):
+    """ Covariance of the Gaussian approximation to exp(log_prob) at its mode x. Parameters at a bound of the prior box (at_bound, an array of bools) keep their own curvature but are decoupled from the others: the mode is not a stationary point along them, so their cross terms would tilt the Gaussian out of the box. Directions with non-positive curvature (e.g. a flat log_f when the errors dominate) are given curvature min_curvature. """
+    H = hessian(log_prob, x, h)
+    if at_bound is not None:
+        diagonal = np.diag(H).copy()
+        H[at_bound, :] = 0.0
+        H[:, at_bound] = 0.0
+        H[at_bound, at_bound] = diagonal[at_bound]
+    w, V = np.linalg.eigh(-H)
+    w = np.clip(w, min_curvature, None)
+    return (V / w) @ V.T
+
+
+def draw_truncated(u_map, cov, nsamples, rng, max_tries=100):
+    """ Draw nsamples points in (Fvb, vb, p, log_f) from a Gaussian in log-parameter space, rejecting draws outside the prior box. """
+    lo = np.array([b[0] for b in prior_bounds])
+    hi = np.array([b[1] for b in prior_bounds])
+    samples = np.empty((0, len(u_map)))
+    for _ in range(max_tries):
+        theta = to_theta(rng.multivariate_normal(u_map, cov, size=nsamples))
+        inside = np.all((theta > lo) & (theta < hi), axis=1)
+        samples = np.concatenate([samples, theta[inside]])
+        if len(samples) >= nsamples:
+            return samples[:nsamples]
+    print(
+        f'**warning** only {len(samples)} of {nsamples} Laplace draws fell inside the prior'
+    )
+    return samples
+
+
+backends = {
+    'emcee': EmceeBackend,
+    'laplace': LaplaceBackend,
+    'replicas': ReplicaBackend,
+    'grid': GridBackend,
+}
+
+
+def get_backend(backend):
+    """ Return a sampler backend instance from a backend name ('emcee', 'laplace', 'replicas' or 'grid') or an object with a run(fit) method. """
+    if isinstance(backend, str):
+        if backend not in backends:
+            raise ValueError(
+                f'Unknown sampler backend {backend}, choose from {list(backends)}'
+            )
+        return backends[backend]()
+    return backend
+
+
+moves = {
+    'stretch': emcee.moves.StretchMove,
+    'de': emcee.moves.DEMove,
+    'desnooker': emcee.moves.DESnookerMove,
+    'kde': emcee.moves.KDEMove,
+    'gaussian': lambda: emcee.moves.GaussianMove(1e-3 * np.ones(4)),
+}
+
+
+def get_moves(spec):
+    """ Return an emcee move mix, a list of (move, weight) pairs, from:
+    - None, for emcee's default stretch move
+    - a string such as 'de:0.8,desnooker:0.2', naming moves from the moves dictionary above with their weights (weight defaults to 1)
+    - an emcee move, or a list of (move, weight) pairs where each move is an emcee move or a name from the moves dictionary
+    """
+    if spec is None:
+        return None
+    if isinstance(spec, emcee.moves.Move):
+        return [(spec, 1.0)]
+    if isinstance(spec, str):
+        spec = [
+            (item.split(':')[0].strip(), float(item.split(':')[1]) if ':' in item else 1.0)
+            for item in spec.split(',')
+        ]
+    mix = []
+    for move, weight in spec:
+        if isinstance(move, str):
+            if move not in moves:
+                raise ValueError(f'Unknown move {move}, choose from {list(moves)}')
+            move = moves[move]()
+        mix.append((move, float(weight)))
+    return mix
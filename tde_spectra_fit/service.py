@@ -0,0 +1,340 @@
+""" Local asynchronous fitting service, tde-spectra-fit-service: accepts fit jobs over HTTP (on a TCP port or a Unix socket), runs them on a bounded pool of worker processes and reports sampler progress and results as JSON. Standard library only. """
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+from tde_spectra_fit.cli import run_fit, to_json
+from tde_spectra_fit.store import ResultsStore
+
+# options of a fit job and their defaults, as for the command line tool:
+default_options = dict(
+    break_number=5,
+    nsteps=10000,
+    nwalkers=400,
+    backend='emcee',
+    replicas=4,
+    moves=None,
+    vectorize=False,
+    seed=None,
+    plot=False,
+    sem=False,
+    dL=90,
+    z=0.0206,
+    t=246,
+    geo='spherical',
+)
+
+spectrum_arrays = (
+    'frequency',
+    'fd',
+    'fd_err_low',
+    'fd_err_up',
+    'quiescent_flux_density',
+)
+
+
+# options that must be positive integers:
+positive_options = ('nsteps', 'nwalkers', 'replicas')
+
+
+def parse_job(request):
+    """ Check a job submission, {"spectrum": {...}, "options": {...}}, and return the spectrum (TDE_fit keyword arguments) and the options with defaults filled in. The spectrum has frequency, fd, fd_err_low and fd_err_up arrays (or fd_err for symmetric errors), and optional quiescent_flux_density and name. Raises ValueError for a bad request. """
+    if not isinstance(request, dict) or not isinstance(request.get('spectrum'), dict):
+        raise ValueError('the request needs a spectrum object')
+    spectrum = dict(request['spectrum'])
+    if 'fd_err' in spectrum:
+        err = spectrum.pop('fd_err')
+        spectrum.setdefault('fd_err_low', err)
+        spectrum.setdefault('fd_err_up', err)
+    unknown = set(spectrum) - set(spectrum_arrays) - {'name'}
+    if unknown:
+        raise ValueError(f'unknown spectrum fields {sorted(unknown)}')
+    missing = [a for a in spectrum_arrays[:4] if a not in spectrum]
+    if missing:
+        raise ValueError(f'the spectrum has no {", ".join(missing)}')
+    for a in spectrum_arrays:
+        if a in spectrum and not is_number_list(spectrum[a]):
+            raise ValueError(f'the spectrum {a} must be a list of numbers')
+    lengths = {len(spectrum[a]) for a in spectrum_arrays if a in spectrum}
+    if len(lengths) != 1:
+        raise ValueError('the spectrum arrays must all have the same length')
+
+    options = request.get('options') or {}
+    if not isinstance(options, dict):
+        raise ValueError('the options must be an object')
+    unknown = set(options) - set(default_options)
+    if unknown:
+        raise ValueError(f'unknown options {sorted(unknown)}')
+    for key in positive_options:
+        value = options.get(key, default_options[key])
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f'the option {key} must be a positive integer')
+    return spectrum, {**default_options, **options}
+
+
+def is_number_list(value):
+    return isinstance(value, list) and all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in value
+    )
+
+
+def job_key(spectrum, options):
+    """ Hash identifying a fit, so that identical submissions share one job. """
+    text = json.dumps([spectrum, options], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def report_progress(progress, job_id, iteration, nsteps):
+    # each update is a round trip to the manager process, so not at every step:
+    if iteration % max(1, nsteps // 100) == 0 or iteration == nsteps:
+        progress[job_id] = (iteration, nsteps)
+
+
+def run_job(job_id, spectrum, options, progress):
+    """ Fit one job in a worker process, reporting the sampler's progress in the shared progress dictionary. """
+    spectrum = {
+        k: np.array(v, dtype=float) if k in spectrum_arrays else v
+        for k, v in spectrum.items()
+    }
+    callback = functools.partial(report_progress, progress, job_id)
+    return to_json(run_fit(spectrum, options, callback=callback))
+
+
+class FitService:
+    def __init__(self, workers=None, max_queue=100, store=None):
+        """ Queue of fit jobs run on a pool of worker processes. Jobs are kept in memory, keyed by a hash of the spectrum and options, so resubmitting an identical job returns the existing one (a failed job is run again).
+
+        Parameters:
+        workers: integer or None, number of worker processes (and jobs run at once), default the number of CPUs
+        max_queue: integer, number of jobs that can wait for a worker, further submissions are refused
+        store: string or None, SQLite catalogue (see store.py) to add the results and posterior samples of finished jobs to
+
+        """
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_queue = max_queue
+        self.jobs = {}
+        self.server = None
+        self.store = ResultsStore(store) if store is not None else None
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """ Start the worker pool and listen for HTTP requests on host:port, or on the Unix socket path if given. """
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.dict()
+        # spawned rather than forked, so that workers started while a request is
+        # being answered do not inherit (and hold open) its connection:
+        self.pool = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context('spawn')
+        )
+        self.queue = asyncio.Queue(self.max_queue)
+        self.runners = [
+            asyncio.create_task(self.run_jobs()) for _ in range(self.workers)
+        ]
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for runner in self.runners:
+            runner.cancel()
+        await asyncio.gather(*self.runners, return_exceptions=True)
+        self.pool.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+        if self.store is not None:
+            self.store.close()
+
+    def submit(self, request):
+        """ Queue a job, returns the job and whether it duplicates an existing one. Raises ValueError for a bad request and asyncio.QueueFull when too many jobs are waiting. """
+        spectrum, options = parse_job(request)
+        job_id = job_key(spectrum, options)[:16]
+        job = self.jobs.get(job_id)
+        if job is not None and job['status'] != 'failed':
+            return job, True
+
+        job = dict(
+            id=job_id,
+            name=spectrum.get('name'),
+            status='queued',
+            submitted=time.time(),
+            started=None,
+            finished=None,
+            result=None,
+            error=None,
+        )
+        self.queue.put_nowait((job, spectrum, options))
+        self.jobs[job_id] = job
+        self.progress[job_id] = (0, options['nsteps'])
+        return job, False
+
+    async def run_jobs(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, spectrum, options = await self.queue.get()
+            if self.store is not None:
+                options = dict(options, samples_dir=self.store.samples_dir)
+            job['status'] = 'running'
+            job['started'] = time.time()
+            try:
+                job['result'] = await loop.run_in_executor(
+                    self.pool, run_job, job['id'], spectrum, options, self.progress
+                )
+                job['status'] = 'done'
+                if self.store is not None:
+                    self.store.insert([job['result']])
+            except Exception as e:
+                job['error'] = f'{type(e).__name__}: {e}'
+                job['status'] = 'failed'
+            job['finished'] = time.time()
+            self.queue.task_done()
+
+    def describe(self, job):
+        """ The job as returned by the service, with the sampler progress. """
+        description = dict(job)
+        step, nsteps = self.progress[job['id']]
+        if job['status'] == 'done':
+            step = nsteps
+        description['progress'] = dict(step=step, nsteps=nsteps, fraction=step / nsteps)
+        return description
+
+    def route(self, method, path, body):
+        """ Answer one request, returns the HTTP status and a JSON-able payload.
+
+        POST /jobs                submit a job, see parse_job
+        GET  /jobs                list the jobs, without their results
+        GET  /jobs/{id}           status, progress and result of a job
+        GET  /health              worker and queue status
+        """
+        parts = path.split('?')[0].strip('/').split('/')
+        if method == 'GET' and parts == ['health']:
+            return HTTPStatus.OK, dict(
+                workers=self.workers,
+                queued=self.queue.qsize(),
+                running=sum(j['status'] == 'running' for j in self.jobs.values()),
+                jobs=len(self.jobs),
+            )
+        if parts[0] != 'jobs' or len(parts) > 2:
+            return HTTPStatus.NOT_FOUND, dict(error=f'no such resource {path}')
+        if len(parts) == 2:
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, dict(error=f'{method} {path}')
+            if parts[1] not in self.jobs:
+                return HTTPStatus.NOT_FOUND, dict(error=f'no job {parts[1]}')
+            return HTTPStatus.OK, self.describe(self.jobs[parts[1]])
+        if method == 'GET':
+            jobs = [self.describe(job) for job in self.jobs.values()]
+            for job in jobs:
+                del job['result']
+            return HTTPStatus.OK, dict(jobs=jobs)
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, dict(error=f'{method} {path}')
+
+        try:
+            job, duplicate = self.submit(json.loads(body or b'null'))
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, dict(error=str(e))
+        except asyncio.QueueFull:
+            return HTTPStatus.SERVICE_UNAVAILABLE, dict(
+                error=f'{self.max_queue} jobs are already waiting, try again later'
+            )
+        status = HTTPStatus.OK if duplicate else HTTPStatus.ACCEPTED
+        return status, dict(self.describe(job), duplicate=duplicate)
+
+    async def handle(self, reader, writer):
+        """ Serve one HTTP/1.1 request per connection. """
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = self.route(method.upper(), path, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = HTTPStatus.BAD_REQUEST, dict(error='malformed request')
+        except Exception as e:
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            payload = dict(error=f'{type(e).__name__}: {e}')
+
+        try:
+            data = json.dumps(to_json(payload)).encode()
+            writer.write(
+                f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(data)}\r\n'
+                'Connection: close\r\n\r\n'.encode('latin-1')
+                + data
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(
+    workers=None, max_queue=100, host='127.0.0.1', port=8765, path=None, store=None
+):
+    service = FitService(workers, max_queue, store)
+    server = await service.start(host, port, path)
+    where = path or f'http://{host}:{port}'
+    print(f'tde-spectra-fit-service on {where} with {service.workers} workers')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='tde-spectra-fit-service',
+        description='Local service queueing radio TDE spectrum fits, submitted as '
+        'JSON over HTTP.',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument(
+        '--socket', default=None, help='listen on this Unix socket instead of a port'
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int, default=None, help='number of worker processes'
+    )
+    parser.add_argument(
+        '--max-queue', type=int, default=100, help='number of jobs that can wait'
+    )
+    parser.add_argument(
+        '--store', default=None, help='SQLite catalogue to add the results to'
+    )
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(
+            serve(
+                args.workers,
+                args.max_queue,
+                args.host,
+                args.port,
+                args.socket,
+                args.store,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+""" Indexed results store: a SQLite catalogue of TDE_fit and SEM results, with the posterior samples of each fit kept next to it as .npy files """
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+# columns of the runs table, one row per fit:
+fit_columns = (
+    ('source', 'TEXT'),
+    ('epoch', 'REAL'),
+    ('name', 'TEXT'),
+    ('break_number', 'INTEGER'),
+    ('backend', 'TEXT'),
+    ('nwalkers', 'INTEGER'),
+    ('nsteps', 'INTEGER'),
+    ('input_hash', 'TEXT'),
+    ('Fvb', 'REAL'),
+    ('vb', 'REAL'),
+    ('p', 'REAL'),
+    ('log_f', 'REAL'),
+    ('Fp', 'REAL'),
+    ('vp', 'REAL'),
+    ('Fvb_u', 'REAL'),
+    ('vb_u', 'REAL'),
+    ('p_u', 'REAL'),
+    ('Fp_u', 'REAL'),
+    ('acceptance_fraction', 'REAL'),
+    ('nsamples', 'INTEGER'),
+    ('samples', 'TEXT'),
+)
+
+# columns for SEM.results (NULL for fits without an SEM analysis). SQLite column names
+# are case insensitive, so ne and Ne need different names:
+sem_columns = {
+    't': 'sem_t',
+    'Req': 'sem_Req',
+    'Eeq': 'sem_Eeq',
+    'beta_ej': 'sem_beta_ej',
+    'M_ej': 'sem_M_ej',
+    'ne': 'sem_ambient_density',
+    'B': 'sem_B',
+    'Ne': 'sem_electron_number',
+}
+
+indexes = (
+    ('source', 'epoch'),
+    ('source', 'p'),
+    ('break_number', 'p'),
+    ('input_hash',),
+)
+
+
+def backend_settings(backend):
+    """ The parameters of a sampler backend that are plain values, e.g. LaplaceBackend.nsamples or GridBackend.npoints. """
+    return {
+        k: v
+        for k, v in sorted(vars(backend).items())
+        if isinstance(v, (bool, int, float, str, tuple, type(None)))
+    }
+
+
+def input_hash(fit):
+    """ Hash of the spectrum and sampler settings of a TDE_fit (break, walkers, steps, burn-in, starting point, move mix, vectorize and the backend and its parameters), identifying fits of the same data with the same setup. """
+    h = hashlib.sha256()
+    for array in (
+        fit.frequency,
+        fit.fd,
+        fit.fd_err_low,
+        fit.fd_err_up,
+        fit.quiescent_flux_density,
+    ):
+        if array is not None:
+            h.update(np.ascontiguousarray(array, dtype=float).tobytes())
+        h.update(b'|')
+    settings = [
+        fit.break_number,
+        fit.nwalkers,
+        fit.nsteps,
+        fit.burnin,
+        list(fit.initial),
+        fit.backend.name,
+        backend_settings(fit.backend),
+        [[type(move).__name__, weight] for move, weight in fit.moves or []],
+        fit.vectorize,
+    ]
+    h.update(json.dumps(settings).encode())
+    return h.hexdigest()
+
+
+def posterior_samples(fit, thin=15):
+    """ Flat post burn-in samples of Fvb, vb, p and log_f of a finished fit, thinned as in do_fit, or None if the chain was not stored. """
+    if fit.sampler is None or not fit.store_chain:
+        return None
+    return fit.sampler.get_chain(discard=fit.stored_burnin, thin=thin, flat=True)
+
+
+def save_samples(directory, samples):
+    """ Write samples to a new .npy file in directory and return its path. """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{uuid.uuid4().hex}.npy')
+    np.save(path, samples)
+    return path
+
+
+def fit_result(fit, sem=None, source=None, epoch=None):
+    """ Dictionary of the results and diagnostics of a finished fit (and optionally the SEM analysis run on it), in the form returned by the command line tool and stored by ResultsStore. """
+    result = dict(
+        name=fit.name,
+        source=source or fit.name,
+        epoch=epoch,
+        break_number=fit.break_number,
+        backend=fit.backend.name,
+        nwalkers=fit.nwalkers,
+        nsteps=fit.nsteps,
+        input_hash=input_hash(fit),
+    )
+    result.update(fit.summary)
+    if sem is not None:
+        result['sem'] = sem.results
+    return result
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class ResultsStore:
+    def __init__(self, path='tde_results.sqlite', samples_dir=None):
+        """ Catalogue of fit results in a SQLite database, indexed for queries by source, epoch, break number and p. Each fit is one row of the runs table, with its summary statistics, SEM results (sem_ columns, see sem_columns) and any other diagnostics (the diagnostics column, as JSON). Posterior samples are kept out of the database, as .npy files named in the samples column.
+
+        Parameters:
+        path: string, SQLite database file, created if it does not exist
+        samples_dir: string or None, directory for the sample files, default {path without extension}_samples
+
+        Example:
+        store = ResultsStore('catalogue.sqlite')
+        store.record(fit, sem=sem, source='ASASSN-14li', epoch=246)
+        store.query(source='ASASSN-14li', p=(2.5, 3))
+        """
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.samples_dir = samples_dir or f'{os.path.splitext(path)[0]}_samples'
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.columns = (
+            [name for name, _ in fit_columns]
+            + list(sem_columns.values())
+            + ['diagnostics', 'created']
+        )
+
+        definitions = [f'{name} {kind}' for name, kind in fit_columns]
+        definitions += [f'{column} REAL' for column in sem_columns.values()]
+        definitions += ['diagnostics TEXT', 'created REAL']
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs '
+                f'(id INTEGER PRIMARY KEY, {", ".join(definitions)})'
+            )
+            for index in indexes:
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS runs_{"_".join(index)} '
+                    f'ON runs ({", ".join(index)})'
+                )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def row(self, result):
+        """ Values of the runs columns for a result dictionary from fit_result (or the command line tool). """
+        values = {name: result.get(name) for name, _ in fit_columns}
+        if values['samples'] is not None:
+            # relative to the database, so that the catalogue can be moved as a whole:
+            values['samples'] = os.path.relpath(values['samples'], self.root)
+        sem = result.get('sem') or {}
+        for key, column in sem_columns.items():
+            values[column] = sem.get(key)
+        other = {
+            k: v
+            for k, v in result.items()
+            if k not in values and k not in ('sem', 'error')
+        }
+        values['diagnostics'] = json.dumps(other, default=_json_default)
+        values['created'] = time.time()
+        return [
+            v.item() if isinstance(v, np.generic) else v
+            for v in (values[c] for c in self.columns)
+        ]
+
+    def insert(self, results):
+        """ Add result dictionaries (e.g. all results of a batch run) in one transaction, returns their ids. Failed fits (with an error) are skipped. """
+        rows = [self.row(r) for r in results if 'error' not in r]
+        placeholders = ', '.join('?' * len(self.columns))
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT INTO runs ({", ".join(self.columns)}) VALUES ({placeholders})',
+                rows,
+            )
+            # the rows of one transaction get consecutive ids:
+            last = self.connection.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return list(range(last - len(rows) + 1, last + 1))
+
+    def record(self, fit, sem=None, source=None, epoch=None, samples=True):
+        """ Add a finished fit (and optionally the SEM analysis run on it), returns its id. source defaults to the fit's name and epoch (e.g. days since launch) to None. Set samples=False to not keep the posterior samples. """
+        result = fit_result(fit, sem=sem, source=source, epoch=epoch)
+        flat = posterior_samples(fit) if samples else None
+        if flat is not None:
+            result['samples'] = save_samples(self.samples_dir, flat)
+        return self.insert([result])[0]
+
+    def query(self, order_by='epoch', **selection):
+        """ Runs matching the selection, as a list of dictionaries ordered by order_by. Each keyword is a column name with either a value to match or a (low, high) range, inclusive, e.g. query(source='ASASSN-14li', p=(2.5, 3)). A bound of None leaves that side open. """
+        conditions, values = [], []
+        for column, value in selection.items():
+            if column not in self.columns and column != 'id':
+                raise ValueError(f'Unknown column {column}, choose from {self.columns}')
+            if isinstance(value, (tuple, list)):
+                low, high = value
+                if low is not None:
+                    conditions.append(f'{column} >= ?')
+                    values.append(low)
+                if high is not None:
+                    conditions.append(f'{column} <= ?')
+                    values.append(high)
+            elif value is None:
+                conditions.append(f'{column} IS NULL')
+            else:
+                conditions.append(f'{column} = ?')
+                values.append(value)
+        if order_by not in self.columns and order_by != 'id':
+            raise ValueError(f'Unknown column {order_by}, choose from {self.columns}')
+
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.connection.execute(
+            f'SELECT * FROM runs {where} ORDER BY {order_by}, id', values
+        ).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            result['diagnostics'] = json.loads(result['diagnostics'])
+            results.append(result)
+        return results
+
+    def load_samples(self, result):
+        """ Memory map the posterior samples of a run returned by query, shape (nsamples, 4), or None if none were kept. """
+        if result['samples'] is None:
+            return None
+        return np.load(os.path.join(self.root, result['samples']), mmap_mode='r')
@@ -0,0 +1,219 @@
+""" Streaming posterior summaries, updated while emcee runs, so percentiles are available without the flat chain """
+import numpy as np
+
+from tde_spectra_fit.likelihood import powerlaw
+
+
+class RunningMoments:
+    def __init__(self, ndim):
+        """ Running count, mean, variance, minimum and maximum of ndim quantities (Welford's algorithm, merged with Chan et al's formula). """
+        self.n = 0
+        self.mean = np.zeros(ndim)
+        self.m2 = np.zeros(ndim)
+        self.min = np.full(ndim, np.inf)
+        self.max = np.full(ndim, -np.inf)
+
+    def update(self, x):
+        """ Add a batch of samples x of shape (nsamples, ndim). """
+        other = RunningMoments(x.shape[1])
+        other.n = len(x)
+        other.mean = x.mean(axis=0)
+        other.m2 = ((x - other.mean) ** 2).sum(axis=0)
+        other.min = x.min(axis=0)
+        other.max = x.max(axis=0)
+        self.merge(other)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.n * other.n / n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.n = n
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.n - 1, 1))
+
+
+class _BucketStore:
+    """ Dense counts of integer bucket keys, growing as needed. """
+
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, keys, counts=None):
+        if len(keys) == 0:
+            return
+        lo, hi = keys.min(), keys.max()
+        self._extend(lo, hi)
+        self.counts += np.bincount(
+            keys - self.offset, weights=counts, minlength=len(self.counts)
+        ).astype(np.int64)
+
+    def _extend(self, lo, hi):
+        if len(self.counts) == 0:
+            self.offset = lo
+            self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            return
+        new_lo = min(lo, self.offset)
+        new_hi = max(hi, self.offset + len(self.counts) - 1)
+        if new_lo < self.offset or new_hi >= self.offset + len(self.counts):
+            counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+            start = self.offset - new_lo
+            counts[start : start + len(self.counts)] = self.counts
+            self.offset, self.counts = new_lo, counts
+
+    def merge(self, other):
+        if len(other.counts):
+            self.add(np.arange(len(other.counts)) + other.offset, other.counts)
+
+    def keys(self):
+        return np.arange(len(self.counts)) + self.offset
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy=1e-3, min_value=1e-12):
+        """ Mergeable quantile sketch with bounded relative error (the DDSketch of Masson et al 2019): values are counted in logarithmically spaced buckets, so any quantile is returned to within relative_accuracy of a sample value, in constant memory. Values smaller in magnitude than min_value are counted as zero. """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.min_value = min_value
+        self.positive = _BucketStore()
+        self.negative = _BucketStore()
+        self.zero = 0
+        self.n = 0
+
+    def update(self, x):
+        x = np.ravel(x)
+        x = x[np.isfinite(x)]
+        self.n += len(x)
+        small = np.abs(x) < self.min_value
+        self.zero += np.sum(small)
+        for store, values in (
+            (self.positive, x[~small & (x > 0)]),
+            (self.negative, -x[~small & (x < 0)]),
+        ):
+            keys = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+            store.add(keys)
+
+    def merge(self, other):
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zero += other.zero
+        self.n += other.n
+        return self
+
+    def quantile(self, q):
+        """ Value of the q-th quantile(s), q in [0, 1], of the values seen so far. """
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan)
+        # bucket values in increasing order: negatives, zero, positives
+        values = np.concatenate(
+            [
+                -self._bucket_values(self.negative.keys())[::-1],
+                [0.0],
+                self._bucket_values(self.positive.keys()),
+            ]
+        )
+        counts = np.concatenate(
+            [self.negative.counts[::-1], [self.zero], self.positive.counts]
+        )
+        cumulative = np.cumsum(counts)
+        rank = np.asarray(q) * (self.n - 1)
+        return values[np.searchsorted(cumulative, rank, side='right')]
+
+    def _bucket_values(self, keys):
+        return 2 * self.gamma ** keys / (self.gamma + 1)
+
+
+# frequencies (GHz) on which do_fit finds the peak of the model spectrum:
+peak_frequencies = np.linspace(0, 30, 100)
+
+
+def spectral_peak(theta, break_number, vs=peak_frequencies):
+    """ Peak frequency vp and peak flux density Fp of the model spectrum for each row of theta (Fvb, vb, p, log_f), read off the vs grid as in do_fit. """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        flux = powerlaw(vs, theta[:, :1], theta[:, 1:2], theta[:, 2:3], break_number)
+    flux = np.where(np.isfinite(flux), flux, -np.inf)
+    peak = np.argmax(flux, axis=1)
+    return vs[peak], flux[np.arange(len(theta)), peak]
+
+
+class StreamingSummary:
+
+    labels = ("Fvb", "vb", "p", "log(f)", "vp", "Fp")
+
+    def __init__(
+        self, break_number, burnin=0, relative_accuracy=1e-3, buffer_steps=50
+    ):
+        """ Online posterior summary of an emcee run: running moments and quantile sketches of Fvb, vb, p, log_f and the derived peak frequency vp and peak flux density Fp, updated at every step past burnin. Summaries from independent runs can be merged.
+
+        Parameters:
+        break_number: integer, spectral break used for the derived vp and Fp
+        burnin: integer, steps before this are not summarised
+        relative_accuracy: float, relative error of the quantiles
+        buffer_steps: integer, number of steps collected before the summaries are updated
+
+        """
+        self.break_number = break_number
+        self.burnin = burnin
+        self.buffer_steps = buffer_steps
+        self.moments = RunningMoments(len(self.labels))
+        self.sketches = [QuantileSketch(relative_accuracy) for _ in self.labels]
+        self._buffer = []
+
+    def update(self, coords, iteration):
+        """ Add the walker positions, shape (nwalkers, 4), of the given (1-based) step. """
+        if iteration <= self.burnin:
+            return
+        self._buffer.append(np.array(coords))
+        if len(self._buffer) >= self.buffer_steps:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        theta = np.concatenate(self._buffer)
+        self._buffer = []
+        vp, Fp = spectral_peak(theta, self.break_number)
+        x = np.column_stack([theta, vp, Fp])
+        self.moments.update(x)
+        for i, sketch in enumerate(self.sketches):
+            sketch.update(x[:, i])
+
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        self.moments.merge(other.moments)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+        return self
+
+    @property
+    def nsamples(self):
+        return self.moments.n + sum(len(b) for b in self._buffer)
+
+    def percentiles(self, q=(16, 50, 84)):
+        """ Array of shape (6, len(q)), the q-th percentiles of Fvb, vb, p, log_f, vp and Fp so far. """
+        self.flush()
+        return np.array([s.quantile(np.array(q) / 100) for s in self.sketches])
+
+    def results(self):
+        """ Dictionary of the mean, standard deviation and 16th, 50th and 84th percentiles of each quantity so far. """
+        percentiles = self.percentiles()
+        std = self.moments.std
+        return {
+            label: dict(
+                mean=self.moments.mean[i],
+                std=std[i],
+                p16=percentiles[i, 0],
+                median=percentiles[i, 1],
+                p84=percentiles[i, 2],
+            )
+            for i, label in enumerate(self.labels)
+        }
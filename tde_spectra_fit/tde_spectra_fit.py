@@ -3,8 +3,21 @@ import numpy as np
 import emcee
 import matplotlib.pyplot as plt
 import corner
+from contextlib import nullcontext
 from IPython.display import display, Math
 
+from tde_spectra_fit.likelihood import (
+    log_probability,
+    log_probability_vectorized,
+    p_free_breaks,
+)
+from tde_spectra_fit.likelihood import powerlaw as _powerlaw
+from tde_spectra_fit.chains import CompactBackend, MemmapBackend
+from tde_spectra_fit.plotting import ChainSummary, plot_corner, plot_traces
+from tde_spectra_fit.profiling import FitProfile
+from tde_spectra_fit.samplers import get_backend, get_moves
+from tde_spectra_fit.summaries import StreamingSummary
+
 
 """Main module."""
 
@@ -38,6 +51,17 @@ class TDE_fit:
         nsteps=10000,
         nwalkers=400,
         initial=(2.21, 2.68, 2.8),
+        backend='emcee',
+        moves=None,
+        profile=False,
+        vectorize=False,
+        chain_file=None,
+        streaming=False,
+        store_chain=True,
+        callback=None,
+        chain_dtype=None,
+        store_log_prob=True,
+        drop_burnin=False,
     ):
 
         """ This class takes in a radio TDE spectrum and uses emcee to fit a powerlaw to the data to determine the peak frequency, peak flux density, and powerlaw index, p.
@@ -53,6 +77,17 @@ class TDE_fit:
         nsteps: integer, number of steps you want to run emcee for
         nwalkers: integer, number of walkers you want emcee to use
         initial: the initial guess for Fvb, vb, and p for the spectrum
+        backend: string or backend object, sampler used by do_fit. 'emcee' runs the full MCMC, 'laplace' gives a fast Gaussian (Laplace) approximation about the maximum a posteriori fit, useful to triage many spectra before running emcee on the interesting ones. 'replicas' runs several independent emcee ensembles in parallel and checks that they agree (split R-hat) before merging them. 'grid' evaluates the posterior deterministically on a progressively refined grid, with log_f marginalised numerically, and also keeps the log evidence and the percentiles of vp and Fp in the summary. See samplers.py, replicas.py and grid.py.
+        moves: None, string or list, mix of emcee moves with weights, e.g. 'de:0.8,desnooker:0.2' or [(emcee.moves.DEMove(), 0.8), (emcee.moves.DESnookerMove(), 0.2)]. None uses emcee's default stretch move. Use mixing.benchmark_moves to compare mixes on the reference spectra.
+        profile: True or False, set True to record stage timings, likelihood call counts, acceptance fractions and peak memory, written to {name}_profile.json by do_fit. See profiling.py.
+        vectorize: True or False, set True to evaluate the log-probability of all walkers in one batched numpy call (emcee's vectorize option) instead of one call per walker.
+        chain_file: string or None, .npy file to keep the emcee chain in (memory mapped) instead of in memory, for long runs. do_fit then draws the trace and corner plots from histograms accumulated over chunks of the chain, and also saves the trace plot to {name}_chains.pdf. See chains.py and plotting.py.
+        streaming: True or False, set True to update running moments and quantile sketches of the parameters and of the derived vp and Fp at every emcee step past burn-in (see summaries.py). do_fit then takes its percentiles from these instead of the flat chain, and streaming_summary.results() can be read while the sampler runs.
+        store_chain: True or False, set False (with streaming=True, and without chain_file) to not store the chain at all. There are then no chain or corner plots and no autocorrelation time, but the acceptance fraction is still counted.
+        callback: function or None, called as callback(iteration, nsteps) after every emcee step, e.g. to report progress. It must be picklable to use the replicas backend.
+        chain_dtype: numpy dtype or None, dtype of the stored chain, e.g. np.float32 to halve its memory (and chain_file size). Default float64.
+        store_log_prob: True or False, set False to not store the log-probability of every step, which do_fit does not use
+        drop_burnin: True or False, set True to not store the burn-in steps at all, so the stored chain starts after them. See chains.CompactBackend.
 
         """
 
@@ -68,6 +103,24 @@ class TDE_fit:
         self.ndim = 4
         self.burnin = 150
         self.initial = initial
+        self.backend = get_backend(backend)
+        self.moves = get_moves(moves)
+        self.vectorize = vectorize
+        self.chain_file = chain_file
+        self.streaming = streaming
+        self.store_chain = store_chain
+        self.streaming_summary = None
+        self.callback = callback
+        self.chain_dtype = chain_dtype
+        self.store_log_prob = store_log_prob
+        self.drop_burnin = drop_burnin
+        if not store_chain and not streaming:
+            raise ValueError('store_chain=False needs streaming=True to summarise the fit')
+        if not store_chain and chain_file is not None:
+            raise ValueError('store_chain=False stores no chain to write to chain_file')
+        self.profile = FitProfile(name, vectorize=vectorize) if profile else None
+        self.summary = None
+        self.sampler = None
 
         if self.quiescent_flux_density is not None:
             self.flux_emission = self.fd - self.quiescent_flux_density
@@ -105,258 +158,186 @@ class TDE_fit:
     def run_emcee(self):
 
         break_number = self.break_number
+        if break_number in p_free_breaks:
+            print('**warning** p is not being fitted for this choice of break number')
 
-        def powerlaw(v, Fvb, vb, p):
-
-            if break_number == 1:
-                # if vsa < vm (slow cooling)
-                print(
-                    '**warning** p is not being fitted for this choice of break number'
-                )
-                beta1 = 2
-                beta2 = 1 / 3
-                s = 1.64
-
-            if break_number == 2:
-                beta1 = 1 / 3
-                beta2 = (1 - p) / 2
-                s = 1.84 - (0.4 * p)
-
-            if break_number == 3:
-                beta1 = (1 - p) / 2
-                beta2 = -p / 2
-                s = 1.15 - (0.06 * p)
-
-            if break_number == 4:
-                beta1 = 2
-                beta2 = 5 / 2
-                s = 3.44 * p - 1.41
-
-            if break_number == 5:
-                # if vm < vsa < vs (slow cooling)
-                beta1 = 5 / 2
-                beta2 = (1 - p) / 2
-                s = 1.47 - (0.21 * p)
-
-            if break_number == 6:
-                # if vsa > vm (could be slow or fast cooling)
-                beta1 = 5 / 2
-                beta2 = -p / 2
-                s = 0.94 - 0.14 * p
-
-            if break_number == 7:
-                beta1 = 2
-                beta2 = 11 / 8
-                s = 1.99 - 0.04 * p
-
-            if break_number == 8:
-                # if vc < vsa < vm (fast cooling)
-                print(
-                    '**warning** p is not being fitted for this choice of break number'
-                )
-                beta1 = 11 / 8
-                beta2 = -1 / 2
-                s = 0.907
-
-            if break_number == 9:
-                beta1 = -1 / 2
-                beta2 = -p / 2
-                s = 3.34 - 0.82 * p
-
-            if break_number == 10:
-                print(
-                    '**warning** p is not being fitted for this choice of break number'
-                )
-                beta1 = 11 / 8
-                beta2 = 1 / 3
-                s = 1.213
-
-            if break_number == 11:
-                # if vsa < vc (fast cooling)
-                print(
-                    '**warning** p is not being fitted for this choice of break number'
+        with self.stage('setup'):
+            nwalkers = self.nwalkers
+            nsteps = self.nsteps
+            ndim = 4
+
+            # set up data input for emcee:
+            x = self.frequency
+            y = self.flux_emission
+            yerr = [self.fd_err_low, self.fd_err_up]
+
+            # set initial position:
+            # Fvb, vb, p, f
+            # sol = (1, 9, 2.5, 1)
+            sol = (self.initial[0], self.initial[1], self.initial[2], 1)
+            pos = sol + 1e-4 * np.random.randn(nwalkers, ndim)
+            storage = dict(
+                dtype=self.chain_dtype,
+                store_log_prob=self.store_log_prob,
+                discard=self.burnin if self.drop_burnin else 0,
+            )
+            if self.chain_file is not None:
+                chain_backend = MemmapBackend(self.chain_file, **storage)
+            else:
+                chain_backend = CompactBackend(
+                    store_chain=self.store_chain, **storage
                 )
-                beta1 = 1 / 3
-                beta2 = -1 / 2
-                s = 0.597
-
-            Fv1 = Fvb * ((v / vb) ** (-beta1 * s) + (v / vb) ** (-beta2 * s)) ** (
-                -1 / s
+            if self.profile is not None:
+                log_prob_fn = self.profile.log_probability
+            elif self.vectorize:
+                log_prob_fn = log_probability_vectorized
+            else:
+                log_prob_fn = log_probability
+            sampler = emcee.EnsembleSampler(
+                nwalkers,
+                ndim,
+                log_prob_fn,
+                args=(x, y, yerr, break_number),
+                moves=self.moves,
+                vectorize=self.vectorize,
+                backend=chain_backend,
             )
-
-            return Fv1
-
-        def log_likelihood(theta, x, y, yerr):
-            yerrup = yerr[1]
-            yerrlow = yerr[0]
-            Fvb, vb, p, log_f = theta
-            model = powerlaw(x, Fvb, vb, p)
-            sigma2 = (yerrup ** 2 + model ** 2 * np.exp(2 * log_f)) + (
-                yerrlow ** 2 + model ** 2 * np.exp(2 * log_f)
-            ) / 2
-            return -0.5 * np.sum((y - model) ** 2 / sigma2 + np.log(sigma2))
-
-        def log_prior(theta):
-            Fvb, vb, p, log_f = theta
-            if 0.1 < Fvb < 1e4 and 0.1 < vb < 5 and 1 < p < 3.5 and -10 < log_f < 10:
-                return 0.0
-            return -np.inf
-
-        # combine prior and likelihood for log proability:
-        def log_probability(theta, x, y, yerr):
-
-            lp = log_prior(theta)
-            if not np.isfinite(lp):
-                return -np.inf
-            return lp + log_likelihood(theta, x, y, yerr)
-
-        nwalkers = self.nwalkers
-        nsteps = self.nsteps
-        ndim = 4
-
-        # set up data input for emcee:
-        x = self.frequency
-        y = self.flux_emission
-        yerr = [self.fd_err_low, self.fd_err_up]
-
-        # set initial position:
-        # Fvb, vb, p, f
-        # sol = (1, 9, 2.5, 1)
-        sol = (self.initial[0], self.initial[1], self.initial[2], 1)
-        pos = sol + 1e-4 * np.random.randn(nwalkers, ndim)
-        sampler = emcee.EnsembleSampler(
-            nwalkers, ndim, log_probability, args=(x, y, yerr)
-        )
-        sampler.run_mcmc(pos, nsteps, progress=True)
+        if self.streaming:
+            self.streaming_summary = StreamingSummary(break_number, burnin=self.burnin)
+        # with store_chain=False the backend only counts acceptances:
+        states = sampler.sample(pos, iterations=nsteps, progress=True)
+        for iteration, state in enumerate(states, start=1):
+            # summarise each step as it is sampled:
+            if self.streaming:
+                self.streaming_summary.update(state.coords, iteration)
+            if self.callback is not None:
+                self.callback(iteration, nsteps)
+        if self.streaming:
+            self.streaming_summary.flush()
+        if self.chain_file is not None:
+            chain_backend.flush()
 
         return sampler
 
     def powerlaw(self, v, Fvb, vb, p):
         break_number = self.break_number
 
-        if break_number == 1:
-            # if vsa < vm (slow cooling)
-            print('**warning** p is not being fitted for this choice of break number')
-            beta1 = 2
-            beta2 = 1 / 3
-            s = 1.64
-
-        if break_number == 2:
-            beta1 = 1 / 3
-            beta2 = (1 - p) / 2
-            s = 1.84 - (0.4 * p)
-
-        if break_number == 3:
-            beta1 = (1 - p) / 2
-            beta2 = -p / 2
-            s = 1.15 - (0.06 * p)
-
-        if break_number == 4:
-            beta1 = 2
-            beta2 = 5 / 2
-            s = 3.44 * p - 1.41
-
-        if break_number == 5:
-            # if vm < vsa < vs (slow cooling)
-            beta1 = 5 / 2
-            beta2 = (1 - p) / 2
-            s = 1.47 - (0.21 * p)
-
-        if break_number == 6:
-            # if vsa > vm (could be slow or fast cooling)
-            beta1 = 5 / 2
-            beta2 = -p / 2
-            s = 0.94 - 0.14 * p
-
-        if break_number == 7:
-            beta1 = 2
-            beta2 = 11 / 8
-            s = 1.99 - 0.04 * p
-
-        if break_number == 8:
-            # if vc < vsa < vm (fast cooling)
+        if break_number in p_free_breaks:
             print('**warning** p is not being fitted for this choice of break number')
-            beta1 = 11 / 8
-            beta2 = -1 / 2
-            s = 0.907
-
-        if break_number == 9:
-            beta1 = -1 / 2
-            beta2 = -p / 2
-            s = 3.34 - 0.82 * p
 
-        if break_number == 10:
-            print('**warning** p is not being fitted for this choice of break number')
-            beta1 = 11 / 8
-            beta2 = 1 / 3
-            s = 1.213
-
-        if break_number == 11:
-            # if vsa < vc (fast cooling)
-            print('**warning** p is not being fitted for this choice of break number')
-            beta1 = 1 / 3
-            beta2 = -1 / 2
-            s = 0.597
-
-        Fv1 = Fvb * ((v / vb) ** (-beta1 * s) + (v / vb) ** (-beta2 * s)) ** (-1 / s)
-
-        return Fv1
-
-    def do_fit(self,):
+        return _powerlaw(v, Fvb, vb, p, break_number)
+
+    @property
+    def stored_burnin(self):
+        """ Number of burn-in steps at the start of the stored chain, none if they were dropped as the chain was written. """
+        return 0 if self.drop_burnin else self.burnin
+
+    def stage(self, name):
+        """ Context manager timing a stage of the fit when profiling is on. """
+        if self.profile is None:
+            return nullcontext()
+        return self.profile.stage(name)
+
+    def run_sampler(self):
+        with self.stage('sampling'):
+            sampler = self.backend.run(self)
+        if self.profile is not None:
+            self.profile.info.update(
+                backend=self.backend.name, nwalkers=self.nwalkers, nsteps=self.nsteps
+            )
+            self.profile.record_sampler(sampler)
+        return sampler
 
-        # run emcee:
-        sampler = self.run_emcee()
+    def do_fit(self, plot=True):
+        """ Sample the posterior with the chosen backend, print the fit results and return Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u. The same values, with log(f), the autocorrelation time and the mean acceptance fraction, are kept in the summary dictionary, and the sampler in self.sampler (see store.py to keep them in a results catalogue). Set plot=False to skip writing the chain, corner and model spectrum figures. """
 
-        # plot chains:
-        fig, axes = plt.subplots(self.ndim, figsize=(10, 7), sharex=True)
-        samples = sampler.get_chain()
+        # run the sampler (emcee by default):
+        sampler = self.run_sampler()
+        self.sampler = sampler
         labels = ["Fvb", "vb", "p", "log(f)"]
-        for i in range(self.ndim):
-            ax = axes[i]
-            ax.plot(samples[:, :, i], "k", alpha=0.3)
-            ax.set_xlim(0, len(samples))
-            ax.set_ylabel(labels[i])
-            ax.yaxis.set_label_coords(-0.1, 0.5)
 
-        axes[-1].set_xlabel("step number")
+        # plot chains:
+        burnin = self.stored_burnin
+        with self.stage('plotting'):
+            if plot and not self.store_chain:
+                print('**warning** the chain was not stored, so it cannot be plotted')
+            elif plot and self.chain_file is not None:
+                # reduce the on-disk chain to histograms, a chunk of steps at a time:
+                # (the replicas backend keeps one chain file per replica):
+                if hasattr(sampler, 'get_chains'):
+                    chain = sampler.get_chains()
+                else:
+                    chain = sampler.get_chain()
+                chain_summary = ChainSummary(chain, burnin=burnin, thin=15)
+                fig = plot_traces(chain_summary, labels)
+                fig.savefig(f'{self.name}_chains.pdf')
+            elif plot:
+                fig, axes = plt.subplots(self.ndim, figsize=(10, 7), sharex=True)
+                samples = sampler.get_chain()
+                for i in range(self.ndim):
+                    ax = axes[i]
+                    ax.plot(samples[:, :, i], "k", alpha=0.3)
+                    ax.set_xlim(0, len(samples))
+                    ax.set_ylabel(labels[i])
+                    ax.yaxis.set_label_coords(-0.1, 0.5)
+
+                axes[-1].set_xlabel("step number")
 
         # plot 2D parameter posterior distributions:
-        burnin = self.burnin
-        flat_samples = sampler.get_chain(discard=burnin, thin=15, flat=True)
-        print(flat_samples.shape)
-        fig = corner.corner(flat_samples, labels=labels)
-        fig.savefig(f'{self.name}_2dposteriors.pdf')
+        in_memory_corner = plot and self.store_chain and self.chain_file is None
+        flat_samples = None
+        if self.streaming_summary is None or in_memory_corner:
+            with self.stage('summarising'):
+                flat_samples = sampler.get_chain(discard=burnin, thin=15, flat=True)
+            print(flat_samples.shape)
+        with self.stage('plotting'):
+            if plot and self.store_chain and self.chain_file is not None:
+                fig = plot_corner(chain_summary, labels)
+                fig.savefig(f'{self.name}_2dposteriors.pdf')
+            elif in_memory_corner:
+                fig = corner.corner(flat_samples, labels=labels)
+                fig.savefig(f'{self.name}_2dposteriors.pdf')
         print('----------------------------------------------------------')
         print('MCMC results:')
 
         # get autocorrelation time:
-        try:
-            tau = sampler.get_autocorr_time()
-
-        except:
-            print(
-                '**Warning** The chain is shorter than 50 times the integrated autocorrelation time for 4 parameter(s). Use this estimate with caution and run a longer chain!'
-            )
-            tau = np.inf
+        with self.stage('autocorrelation'):
+            if not self.store_chain:
+                print('**Warning** The chain was not stored, no autocorrelation time.')
+                tau = np.inf
+            else:
+                try:
+                    tau = sampler.get_autocorr_time()
+
+                except:
+                    print(
+                        '**Warning** The chain is shorter than 50 times the integrated autocorrelation time for 4 parameter(s). Use this estimate with caution and run a longer chain!'
+                    )
+                    tau = np.inf
 
         print(
             f'The autocorrelation time is {tau}. You should run the chains for at least 10 x steps as this.'
         )
 
         # extract p plus uncertainties:
-        results = []
-        results_up = []
-        results_low = []
-        print('The MCMC fit parameters are:')
-        for i in range(self.ndim):
-            mcmc = np.percentile(flat_samples[:, i], [16, 50, 84])
-            q = np.diff(mcmc)
-            txt = "\mathrm{{{3}}} = {0:.3f}_{{-{1:.3f}}}^{{{2:.3f}}}"
-            txt = txt.format(mcmc[1], q[0], q[1], labels[i])
-            results.append(mcmc[1])
-            results_up.append(q[1])
-            results_low.append(q[0])
-            display(Math(txt))
+        with self.stage('summarising'):
+            results = []
+            results_up = []
+            results_low = []
+            print('The MCMC fit parameters are:')
+            if self.streaming_summary is not None:
+                percentiles = self.streaming_summary.percentiles([16, 50, 84])
+            else:
+                percentiles = np.percentile(flat_samples, [16, 50, 84], axis=0).T
+            for i in range(self.ndim):
+                mcmc = percentiles[i]
+                q = np.diff(mcmc)
+                txt = "\mathrm{{{3}}} = {0:.3f}_{{-{1:.3f}}}^{{{2:.3f}}}"
+                txt = txt.format(mcmc[1], q[0], q[1], labels[i])
+                results.append(mcmc[1])
+                results_up.append(q[1])
+                results_low.append(q[0])
+                display(Math(txt))
 
         print('----------------------------------------------------------')
 
@@ -364,46 +345,53 @@ class TDE_fit:
 
         # plot flux density SED:
 
-        f = plt.figure(figsize=(8, 8))
+        with self.stage('summarising'):
+            vs = np.linspace(0, 30, 100)
 
-        vs = np.linspace(0, 30, 100)
+            emcee_flux = self.powerlaw(vs, results[0], results[1], results[2])
+            emcee_flux_up = self.powerlaw(
+                vs, results_up[0], results_up[1], results_up[2]
+            )
+            emcee_flux_low = self.powerlaw(
+                vs, results_low[0], results_low[1], results_low[2]
+            )
 
-        emcee_flux = self.powerlaw(vs, results[0], results[1], results[2])
-        emcee_flux_up = self.powerlaw(vs, results_up[0], results_up[1], results_up[2])
-        emcee_flux_low = self.powerlaw(
-            vs, results_low[0], results_low[1], results_low[2]
-        )
+        with self.stage('plotting'):
+            if plot:
+                f = plt.figure(figsize=(8, 8))
+
+                plt.scatter(self.frequency, self.flux_emission)
+                plt.errorbar(
+                    self.frequency,
+                    self.flux_emission,
+                    yerr=[self.fd_err_up, self.fd_err_low],
+                    fmt='.',
+                    capsize=2,
+                )
 
-        plt.scatter(self.frequency, self.flux_emission)
-        plt.errorbar(
-            self.frequency,
-            self.flux_emission,
-            yerr=[self.fd_err_up, self.fd_err_low],
-            fmt='.',
-            capsize=2,
-        )
+                plt.plot(vs, emcee_flux)
+                plt.plot(vs, emcee_flux + emcee_flux_up, color='grey', alpha=0.5)
+                plt.plot(vs, emcee_flux - emcee_flux_low, color='grey', alpha=0.5)
+                # plt.plot(frequency[5:], 4*frequency[5:]**-3)
 
-        plt.plot(vs, emcee_flux)
-        plt.plot(vs, emcee_flux + emcee_flux_up, color='grey', alpha=0.5)
-        plt.plot(vs, emcee_flux - emcee_flux_low, color='grey', alpha=0.5)
-        # plt.plot(frequency[5:], 4*frequency[5:]**-3)
+                # plt.axhline(y=np.max(flux_emission),label=r'F_p')
 
-        # plt.axhline(y=np.max(flux_emission),label=r'F_p')
+                plt.xscale('log')
+                plt.yscale('log')
 
-        plt.xscale('log')
-        plt.yscale('log')
-
-        # plt.axis([1, 30, 0.5e-2,12e-2])
+                # plt.axis([1, 30, 0.5e-2,12e-2])
 
-        plt.xlabel('Frequency (GHz)')
-        plt.ylabel('Flux Density (mJy)')
+                plt.xlabel('Frequency (GHz)')
+                plt.ylabel('Flux Density (mJy)')
 
-        plt.axvline(
-            x=vs[np.where(emcee_flux == np.max(emcee_flux))], ls='--', color='grey'
-        )
-        plt.axhline(y=np.max(emcee_flux), ls='--', color='grey')
+                plt.axvline(
+                    x=vs[np.where(emcee_flux == np.max(emcee_flux))],
+                    ls='--',
+                    color='grey',
+                )
+                plt.axhline(y=np.max(emcee_flux), ls='--', color='grey')
 
-        plt.savefig(f'{self.name}_model_spectrum.pdf')
+                plt.savefig(f'{self.name}_model_spectrum.pdf')
 
         # print peak flux, peak frequency, and p of spectrum:
         print('----------------------------------------------------------')
@@ -424,5 +412,34 @@ class TDE_fit:
         Fp = np.max(emcee_flux)
         Fp_u = Ferror[0]
         vp = vs[np.where(emcee_flux == np.max(emcee_flux))][0]
+
+        # keep the results and diagnostics for batch use (cli.py):
+        self.summary = dict(
+            Fvb=Fvb,
+            vb=vb,
+            p=p,
+            log_f=results[3],
+            Fp=Fp,
+            vp=vp,
+            Fvb_u=Fvb_u,
+            vb_u=vb_u,
+            p_u=p_u,
+            Fp_u=Fp_u,
+            tau=np.broadcast_to(tau, self.ndim).tolist(),
+            acceptance_fraction=np.mean(sampler.acceptance_fraction),
+        )
+        # diagnostics of the replicas, grid and laplace backends:
+        self.summary.update(getattr(sampler, 'diagnostics', {}))
+        if self.streaming_summary is None:
+            self.summary['nsamples'] = len(flat_samples)
+        else:
+            # posterior percentiles of the derived peak, rather than the peak of the median model:
+            self.summary['nsamples'] = self.streaming_summary.nsamples
+            self.summary['vp_percentiles'] = percentiles[4].tolist()
+            self.summary['Fp_percentiles'] = percentiles[5].tolist()
+
+        if self.profile is not None:
+            print(f'Writing profile to {self.profile.write()}')
+
         return Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u
 
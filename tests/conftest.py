@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Shared fixtures for the `tde_spectra_fit` tests."""
+
+import pytest
+
+from tde_spectra_fit.examples import alexander_2016
+
+
+def _write_spectrum(path, delimiter=','):
+    columns = ('frequency', 'fd', 'fd_err_low', 'fd_err_up', 'quiescent_flux_density')
+    with open(path, 'w') as f:
+        if path.suffix == '.ecsv':
+            f.write(f"# %ECSV 1.0\n# ---\n# delimiter: '{delimiter}'\n")
+        f.write(delimiter.join(columns) + '\n')
+        for row in zip(*(alexander_2016[c] for c in columns)):
+            f.write(delimiter.join(str(v) for v in row) + '\n')
+
+
+@pytest.fixture
+def write_spectrum():
+    """Function writing the Alexander et al 2016 spectrum to a CSV (or, for a .ecsv path, ECSV) file."""
+    return _write_spectrum
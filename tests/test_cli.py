@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the `tde-spectra-fit` command line entry point."""
+
+import json
+
+from tde_spectra_fit import cli
+from tde_spectra_fit.examples import alexander_2016
+
+
+def test_read_spectrum(tmp_path, write_spectrum):
+    write_spectrum(tmp_path / 'a.csv')
+    write_spectrum(tmp_path / 'b.ecsv', delimiter=' ')
+    for name in ('a.csv', 'b.ecsv'):
+        spectrum = cli.read_spectrum(str(tmp_path / name))
+        assert spectrum['name'] == name.split('.')[0]
+        assert (spectrum['fd'] == alexander_2016['fd']).all()
+        assert (spectrum['frequency'] == alexander_2016['frequency']).all()
+
+
+def test_main_ndjson(tmp_path, capsys, write_spectrum):
+    write_spectrum(tmp_path / 'a.csv')
+    with open(tmp_path / 'manifest.csv', 'w') as f:
+        f.write('path,name,break_number\na.csv,ASASSN-14li,5\nmissing.csv,,\n')
+
+    status = cli.main(
+        ['-m', str(tmp_path / 'manifest.csv'), '--backend', 'laplace', '--seed', '1']
+    )
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert status == 1
+    assert results[0]['name'] == 'ASASSN-14li'
+    assert 2.6 < results[0]['p'] < 3.0
+    assert 'FileNotFoundError' in results[1]['error']
+
+
+def test_sem_redshift(tmp_path, capsys, write_spectrum):
+    write_spectrum(tmp_path / 'a.csv')
+    Req = []
+    for z in ('0.0206', '0.5'):
+        args = [str(tmp_path / 'a.csv'), '--backend', 'laplace', '--seed', '1']
+        cli.main(args + ['--sem', '--z', z])
+        Req.append(json.loads(capsys.readouterr().out)['sem']['Req'])
+    assert Req[0] != Req[1]
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `tde_spectra_fit.likelihood`."""
+
+import numpy as np
+import pytest
+
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.likelihood import log_probability, log_probability_vectorized
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+@pytest.mark.parametrize('break_number', range(1, 12))
+def test_vectorized_matches_per_walker(break_number):
+    fit = TDE_fit(**alexander_2016)
+    args = (fit.frequency, fit.flux_emission, [fit.fd_err_low, fit.fd_err_up])
+    rng = np.random.default_rng(break_number)
+    theta = np.array([2.2, 2.7, 2.8, -3]) * (1 + 0.3 * rng.standard_normal((50, 4)))
+
+    with np.errstate(all='ignore'):
+        expected = [log_probability(t, *args, break_number) for t in theta]
+        batched = log_probability_vectorized(theta, *args, break_number)
+
+    assert np.allclose(batched, expected, equal_nan=True)
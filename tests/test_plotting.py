@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for on-disk chains (`tde_spectra_fit.chains`) and the out-of-core plots (`tde_spectra_fit.plotting`)."""
+
+import numpy as np
+import pytest
+
+from tde_spectra_fit.chains import load_chain
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.plotting import ChainSummary, plot_corner, plot_traces
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+def test_memmap_chain(tmp_path):
+    chain_file = str(tmp_path / 'chain.npy')
+    np.random.seed(0)
+    S = TDE_fit(**alexander_2016, nwalkers=16, nsteps=300, chain_file=chain_file)
+    sampler = S.run_emcee()
+
+    chain, log_prob = load_chain(chain_file)
+    assert chain.shape == (300, 16, 4)
+    assert log_prob.shape == (300, 16)
+    assert np.array_equal(chain, sampler.get_chain())
+    assert np.array_equal(log_prob, sampler.get_log_prob())
+
+
+def test_storage_policy(tmp_path):
+    compact = dict(chain_dtype=np.float32, store_log_prob=False, drop_burnin=True)
+    fits = {}
+    for name, storage in (
+        ('default', {}),
+        ('compact', compact),
+        ('memmap', dict(compact, chain_file=str(tmp_path / 'chain.npy'))),
+    ):
+        np.random.seed(0)
+        fits[name] = TDE_fit(
+            **alexander_2016, nwalkers=16, nsteps=300, vectorize=True, **storage
+        )
+        fits[name].do_fit(plot=False)
+
+    chain = fits['default'].sampler.get_chain()
+    compact = fits['compact'].sampler
+    # the same run, stored from the end of burn-in in single precision:
+    assert compact.get_chain().dtype == np.float32
+    assert np.allclose(compact.get_chain(), chain[150:], rtol=1e-6)
+    with pytest.raises(AttributeError):
+        compact.get_log_prob()
+    assert fits['compact'].summary['p'] == pytest.approx(fits['default'].summary['p'])
+    assert fits['compact'].summary['nsamples'] == fits['default'].summary['nsamples']
+
+    chain, log_prob = load_chain(str(tmp_path / 'chain.npy'))
+    assert chain.shape == (150, 16, 4) and chain.dtype == np.float32
+    assert log_prob is None
+
+
+def test_chain_summary():
+    rng = np.random.default_rng(0)
+    chain = rng.normal(size=(5000, 8, 3))
+    summary = ChainSummary(
+        chain, burnin=100, thin=5, chunk_steps=300, max_trace_points=1000
+    )
+
+    # every 5th step after burn-in goes into the histograms, as in emcee's get_chain:
+    kept = chain[100 + 5 - 1 :: 5]
+    assert summary.nsamples == kept.shape[0] * 8
+    assert np.array_equal(
+        summary.hist1d[1], np.histogram(kept[..., 1], bins=summary.edges[1])[0]
+    )
+    # range_quantiles leave 1% of the samples outside the histograms:
+    assert 0.98 < summary.hist1d[0].sum() / summary.nsamples < 1
+    assert summary.hist2d[2, 0].sum() <= summary.nsamples
+    # 5000 steps binned 5 at a time:
+    assert summary.envelopes.shape == (1000, 5, 3)
+    assert np.allclose(summary.envelopes[:, 2].mean(axis=0), 0, atol=0.05)
+
+    plot_traces(summary, ['a', 'b', 'c'])
+    plot_corner(summary, ['a', 'b', 'c'])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the opt-in fit instrumentation in `tde_spectra_fit.profiling`."""
+
+import json
+
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.SEM import SEM
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+def test_profile_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    S = TDE_fit(**alexander_2016, nwalkers=16, nsteps=200, profile=True)
+    Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u = S.do_fit(plot=False)
+    SEM(vp=vp, Fvp=Fp, p=p, profile=S.profile).do_analysis()
+
+    with open(tmp_path / 'Alexander_2016_profile.json') as f:
+        report = json.load(f)
+
+    assert set(report['stages']) == {
+        'setup',
+        'sampling',
+        'autocorrelation',
+        'summarising',
+        'plotting',
+        'sem',
+    }
+    # one call per walker for the starting positions, then one per walker per step:
+    assert report['likelihood']['calls'] == 16 * 201
+    assert 0 <= report['likelihood']['prior_rejected_fraction'] < 1
+    assert len(report['acceptance_fraction']['per_walker']) == 16
+
+
+def test_profile_report_without_counted_calls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    S = TDE_fit(**alexander_2016, backend='grid', profile=True)
+    S.do_fit(plot=False)
+    # the grid backend does not evaluate through the counter:
+    assert S.profile.report()['likelihood']['calls_per_second'] is None
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the replica ensembles and convergence diagnostics in `tde_spectra_fit.replicas`."""
+
+import numpy as np
+
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.plotting import ChainSummary
+from tde_spectra_fit.replicas import ReplicaBackend, bulk_ess, split_rhat, tail_ess
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+def test_diagnostics():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(4, 2000))
+    assert abs(split_rhat(x) - 1) < 0.01
+    assert 0.8 * x.size < bulk_ess(x) < 1.2 * x.size
+    assert 0.8 * x.size < tail_ess(x) < 1.2 * x.size
+
+    # one chain stuck elsewhere:
+    x[0] += 2
+    assert split_rhat(x) > 1.1
+
+
+def test_stuck_replica_is_not_merged():
+    rng = np.random.default_rng(1)
+    replicas = []
+    for r in range(3):
+        chain = rng.normal(size=(400, 8, 4))
+        log_prob = np.zeros((400, 8))
+        if r == 1:
+            # stuck in a worse mode:
+            chain += 3
+            log_prob -= 10
+        replicas.append(
+            dict(
+                initial=[1, 1, 1],
+                chain=chain,
+                log_prob=log_prob,
+                acceptance_fraction=np.ones(8),
+            )
+        )
+
+    result = ReplicaBackend(thin=1).merge(replicas, burnin=0)
+    assert result.accepted == [0, 2]
+    assert not result.diagnostics['converged']
+    assert result.get_chain(flat=True).shape == (400 * 16, 4)
+    assert result.get_log_prob().shape == (400, 16)
+    # the same steps as emcee's get_chain(discard=10, thin=7):
+    chain = result.get_chain(discard=10, thin=7)
+    assert np.array_equal(chain[:, :8], replicas[0]['chain'][16::7])
+
+    # the accepted replicas are summarised side by side, without joining them:
+    chains = result.get_chains()
+    assert [c.shape for c in chains] == [(400, 8, 4)] * 2
+    summary = ChainSummary(chains, burnin=100, thin=5, chunk_steps=64)
+    joined = ChainSummary(result.get_chain(), burnin=100, thin=5, chunk_steps=64)
+    assert summary.nwalkers == 16
+    assert summary.nsamples == joined.nsamples
+    assert np.array_equal(summary.hist2d[3, 1], joined.hist2d[3, 1])
+
+
+def test_replica_fit():
+    backend = ReplicaBackend(nreplicas=2, workers=1, seed=3)
+    S = TDE_fit(
+        **alexander_2016, nwalkers=16, nsteps=600, vectorize=True, backend=backend
+    )
+    Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u = S.do_fit(plot=False)
+
+    assert 2.4 < p < 3.2
+    assert S.summary['nreplicas'] == 2
+    assert len(S.summary['rhat']) == 4
+    assert S.summary['nsamples'] == len(S.summary['accepted']) * 16 * 30
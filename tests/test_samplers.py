@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the sampler backends in `tde_spectra_fit.samplers`."""
+
+import emcee
+import numpy as np
+import pytest
+
+from tde_spectra_fit.examples import reference_spectra
+from tde_spectra_fit.grid import GridBackend
+from tde_spectra_fit.likelihood import log_probability
+from tde_spectra_fit.mixing import benchmark_moves
+from tde_spectra_fit.samplers import LaplaceBackend, get_backend, get_moves
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+@pytest.fixture
+def alexander_2016():
+    return TDE_fit(
+        **reference_spectra['Alexander_2016'],
+        backend=LaplaceBackend(nsamples=2000, seed=1),
+    )
+
+
+def test_get_backend():
+    assert get_backend('emcee').name == 'emcee'
+    assert get_backend('laplace').name == 'laplace'
+    with pytest.raises(ValueError):
+        get_backend('nuts')
+
+
+def test_laplace_backend(alexander_2016):
+    result = alexander_2016.run_sampler()
+    assert result.success
+    assert result.get_chain(flat=True).shape == (2000, 4)
+    # emcee gives Fvb = 2.24, vb = 2.69, p = 2.81 for this spectrum:
+    assert np.allclose(result.theta_map[:3], [2.24, 2.69, 2.81], rtol=0.05)
+    # log_f on its lower bound does not count:
+    assert not result.diagnostics['at_prior_bound']
+
+
+def test_laplace_at_prior_bound():
+    # the default spectrum's MAP sits on the Fvb and vb prior bounds:
+    fit = TDE_fit(backend=LaplaceBackend(nsamples=5000, seed=1))
+    result = fit.run_sampler()
+    assert result.diagnostics['at_prior_bound']
+    assert result.nfev < 1000
+    # the grid gives Fvb = 0.115 (0.105-0.135), vb = 4.5 (3.8-4.8) for this spectrum:
+    Fvb, vb = np.percentile(result.get_chain(flat=True)[:, :2], [16, 50, 84], axis=0).T
+    assert 0.1 < Fvb[1] < 0.12 and Fvb[2] < 0.15
+    assert 3.8 < vb[1] < 4.8 and vb[0] > 3
+
+
+def test_laplace_do_fit(alexander_2016):
+    Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u = alexander_2016.do_fit(plot=False)
+    assert 2.6 < p < 3.0
+    # vp is read off a 0.3 GHz grid:
+    assert vp == pytest.approx(3.64, abs=0.35)
+
+
+def test_get_moves():
+    assert get_moves(None) is None
+    mix = get_moves('de:0.8, desnooker:0.2')
+    assert isinstance(mix[0][0], emcee.moves.DEMove)
+    assert isinstance(mix[1][0], emcee.moves.DESnookerMove)
+    assert [w for _, w in mix] == [0.8, 0.2]
+    assert get_moves('kde')[0][1] == 1.0
+    with pytest.raises(ValueError):
+        get_moves('hmc:1')
+
+
+def test_benchmark_moves():
+    rows = benchmark_moves(move_mixes=('stretch', 'de'), nwalkers=16, nsteps=200)
+    assert [row['moves'] for row in rows] == ['stretch', 'de']
+    assert all(row['n_eval'] == 16 * 201 for row in rows)
+
+
+def test_grid_backend():
+    fit = TDE_fit(
+        **reference_spectra['Alexander_2016'],
+        backend=GridBackend(npoints=24, nlog_f=24, nsamples=5000),
+    )
+    Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u = fit.do_fit(plot=False)
+    result = fit.sampler
+    assert result.nlevels > 1
+    # emcee gives Fvb = 2.24, vb = 2.69, p = 2.81 for this spectrum:
+    assert np.allclose([Fvb, vb, p], [2.24, 2.69, 2.81], rtol=0.03)
+    assert vp == pytest.approx(3.64, abs=0.35)
+    assert np.isfinite(fit.summary['log_evidence'])
+
+    # the broadcast grid likelihood matches log_probability at the grid points:
+    x, y = fit.frequency, fit.flux_emission
+    yerr = [fit.fd_err_low, fit.fd_err_up]
+    index = (3, 5, 7, 11)
+    theta = [c[i] for c, i in zip(result.centres, index)]
+    assert result.log_like[index] == pytest.approx(
+        log_probability(theta, x, y, yerr, fit.break_number)
+    )
+
+    edges, mass = result.marginal(2)
+    assert len(edges) == len(mass) + 1
+    assert mass.sum() == pytest.approx(1)
+    _, _, joint = result.joint(1, 0)
+    assert joint.shape == (len(result.centres[1]), len(result.centres[0]))
+    # the grid is deterministic:
+    assert np.array_equal(result.samples, fit.backend.run(fit).samples)
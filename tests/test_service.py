@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the local fitting service in `tde_spectra_fit.service`."""
+
+import asyncio
+import json
+
+import pytest
+
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.service import FitService, parse_job
+
+
+async def request(path, method, url, body=None):
+    reader, writer = await asyncio.open_unix_connection(path)
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f'{method} {url} HTTP/1.1\r\nContent-Length: {len(data)}\r\n\r\n'.encode()
+        + data
+    )
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+def test_service(tmp_path):
+    spectrum = {
+        k: list(alexander_2016[k])
+        for k in ('frequency', 'fd', 'fd_err_low', 'fd_err_up')
+    }
+    spectrum['name'] = 'ASASSN-14li'
+    job = dict(
+        spectrum=spectrum,
+        options=dict(nwalkers=16, nsteps=300, vectorize=True, seed=1),
+    )
+    socket = str(tmp_path / 'fit.sock')
+
+    async def session():
+        service = FitService(workers=1)
+        await service.start(path=socket)
+        try:
+            status, submitted = await request(socket, 'POST', '/jobs', job)
+            assert status == 202 and not submitted['duplicate']
+            status, again = await request(socket, 'POST', '/jobs', job)
+            assert status == 200 and again['duplicate']
+            assert again['id'] == submitted['id']
+
+            status, bad = await request(socket, 'POST', '/jobs', {'spectrum': {}})
+            assert status == 400
+            scalars = {k: 1 for k in ('frequency', 'fd', 'fd_err_low', 'fd_err_up')}
+            status, bad = await request(socket, 'POST', '/jobs', {'spectrum': scalars})
+            assert status == 400
+            status, bad = await request(
+                socket, 'POST', '/jobs', dict(job, options=dict(nsteps=0))
+            )
+            assert status == 400
+
+            for _ in range(600):
+                status, result = await request(socket, 'GET', f'/jobs/{again["id"]}')
+                if result['status'] in ('done', 'failed'):
+                    break
+                await asyncio.sleep(0.1)
+            status, jobs = await request(socket, 'GET', '/jobs')
+            return result, jobs
+        finally:
+            await service.close()
+
+    result, jobs = asyncio.run(session())
+    assert result['status'] == 'done', result['error']
+    assert result['progress']['fraction'] == 1
+    assert result['result']['name'] == 'ASASSN-14li'
+    assert 2.4 < result['result']['p'] < 3.2
+    assert len(jobs['jobs']) == 1
+
+
+def test_parse_job():
+    spectrum = dict(frequency=[1.4, 5.0], fd=[1, 2], fd_err_low=[0.1, 0.1])
+    spectrum['fd_err_up'] = spectrum['fd_err_low']
+    _, options = parse_job(dict(spectrum=spectrum, options=dict(nwalkers=8)))
+    assert options['nwalkers'] == 8 and options['nsteps'] == 10000
+    for bad in (
+        dict(spectrum=dict(spectrum, fd=1)),
+        dict(spectrum=dict(spectrum, fd=['1', '2'])),
+        dict(spectrum=spectrum, options='fast'),
+        dict(spectrum=spectrum, options=dict(nsteps=0)),
+        dict(spectrum=spectrum, options=dict(replicas=2.5)),
+    ):
+        with pytest.raises(ValueError):
+            parse_job(bad)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the results catalogue in `tde_spectra_fit.store`."""
+
+import numpy as np
+
+from tde_spectra_fit import cli
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.samplers import LaplaceBackend
+from tde_spectra_fit.SEM import SEM
+from tde_spectra_fit.store import ResultsStore, input_hash
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+def test_record_and_query(tmp_path):
+    S = TDE_fit(**alexander_2016, backend=LaplaceBackend(nsamples=500, seed=1))
+    S.do_fit(plot=False)
+    sem = SEM(vp=S.summary['vp'], Fvp=S.summary['Fp'], p=S.summary['p'])
+    sem.do_analysis()
+
+    with ResultsStore(str(tmp_path / 'catalogue.sqlite')) as store:
+        first = store.record(S, sem=sem, source='ASASSN-14li', epoch=143)
+        second = store.record(S, source='ASASSN-14li', epoch=246, samples=False)
+        store.record(S, source='other', epoch=10)
+
+        rows = store.query(source='ASASSN-14li', p=(2.5, 3))
+        assert [r['id'] for r in rows] == [first, second]
+        assert [r['epoch'] for r in rows] == [143, 246]
+        assert rows[0]['sem_Req'] == sem.results['Req']
+        assert rows[1]['sem_Req'] is None
+        assert rows[0]['input_hash'] == rows[1]['input_hash']
+        assert rows[0]['diagnostics']['tau'] == [1, 1, 1, 1]
+        assert store.query(source='ASASSN-14li', p=(3, None)) == []
+
+        samples = store.load_samples(rows[0])
+        assert samples.shape == (500, 4)
+        assert np.allclose(np.median(samples[:, 2]), S.summary['p'])
+        assert store.load_samples(rows[1]) is None
+
+
+def test_input_hash_setup():
+    def fit_hash(**kwargs):
+        return input_hash(TDE_fit(**alexander_2016, **kwargs))
+
+    assert fit_hash() == fit_hash()
+    assert fit_hash() != fit_hash(vectorize=True)
+    assert fit_hash() != fit_hash(moves='de')
+    assert fit_hash(backend=LaplaceBackend(nsamples=500)) != fit_hash(
+        backend=LaplaceBackend(nsamples=1000)
+    )
+
+
+def test_cli_store(tmp_path, capsys, write_spectrum):
+    for name in ('a', 'b'):
+        write_spectrum(tmp_path / f'{name}.csv')
+    with open(tmp_path / 'manifest.csv', 'w') as f:
+        f.write('path,source,epoch\na.csv,ASASSN-14li,143\nb.csv,ASASSN-14li,246\n')
+    path = str(tmp_path / 'catalogue.sqlite')
+
+    status = cli.main(
+        ['-m', str(tmp_path / 'manifest.csv'), '--backend', 'laplace', '--store', path]
+    )
+    assert status == 0
+
+    with ResultsStore(path) as store:
+        rows = store.query(source='ASASSN-14li', break_number=5)
+        assert [r['name'] for r in rows] == ['a', 'b']
+        assert store.load_samples(rows[1]).shape[1] == 4
+
+
+def test_sem_save(tmp_path):
+    sem = SEM(save=True, name=str(tmp_path / 'sem'))
+    sem.do_analysis()
+    with open(tmp_path / 'sem.txt') as f:
+        header = f.readline()
+    values = np.loadtxt(tmp_path / 'sem.txt', ndmin=2)
+    assert values.shape == (1, len(header.split(',')))
+    assert values[0, 0] == 246
+    keys = ('Req', 'Eeq', 'beta_ej', 'M_ej', 'ne', 'B', 'Ne')
+    assert np.allclose(values[0, 1:], [sem.results[k] for k in keys])
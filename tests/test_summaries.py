@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the streaming posterior summaries in `tde_spectra_fit.summaries`."""
+
+import numpy as np
+import pytest
+
+from tde_spectra_fit.examples import alexander_2016
+from tde_spectra_fit.summaries import QuantileSketch, RunningMoments
+from tde_spectra_fit.tde_spectra_fit import TDE_fit
+
+
+def test_sketch_and_moments_merge():
+    rng = np.random.default_rng(0)
+    x = rng.normal(-1, 3, size=(20000, 2))
+    q = np.array([0.01, 0.16, 0.5, 0.84, 0.99])
+
+    # two halves summarised separately then merged, as for independent runs:
+    sketch, other_sketch = QuantileSketch(), QuantileSketch()
+    moments, other_moments = RunningMoments(2), RunningMoments(2)
+    for batch in np.array_split(x[:7000], 7):
+        sketch.update(batch[:, 0])
+        moments.update(batch)
+    other_sketch.update(x[7000:, 0])
+    other_moments.update(x[7000:])
+    sketch.merge(other_sketch)
+    moments.merge(other_moments)
+
+    exact = np.quantile(x[:, 0], q)
+    assert np.allclose(sketch.quantile(q), exact, rtol=1e-2, atol=1e-2)
+    assert moments.n == 20000
+    assert np.allclose(moments.mean, x.mean(axis=0))
+    assert np.allclose(moments.std, x.std(axis=0, ddof=1))
+    assert np.allclose(moments.min, x.min(axis=0))
+
+
+def test_streaming_fit_without_chain():
+    np.random.seed(0)
+    S = TDE_fit(
+        **alexander_2016, nwalkers=16, nsteps=400, streaming=True, store_chain=False
+    )
+    Fvb, vb, p, Fp, vp, Fvb_u, vb_u, p_u, Fp_u = S.do_fit(plot=False)
+
+    assert S.summary['nsamples'] == 16 * (400 - S.burnin)
+    assert 0 < S.summary['acceptance_fraction'] < 1
+    assert S.sampler.backend.chain.size == 0
+    assert 2.4 < p < 3.2
+    results = S.streaming_summary.results()
+    assert results['p']['p16'] < results['p']['median'] < results['p']['p84']
+    # sketch quantiles are bucket values, within relative_accuracy of a sample:
+    assert results['vp']['p16'] * (1 - 1e-3) <= vp <= results['vp']['p84'] * (1 + 1e-3)
+
+
+def test_chain_file_needs_store_chain(tmp_path):
+    with pytest.raises(ValueError):
+        TDE_fit(
+            **alexander_2016,
+            streaming=True,
+            store_chain=False,
+            chain_file=str(tmp_path / 'chain.npy'),
+        )